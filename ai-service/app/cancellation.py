@@ -0,0 +1,58 @@
+import threading
+from typing import Dict, List
+
+# --- Cooperative job cancellation ---
+# Each processing run registers a token under its document id. Cancelling the
+# document flips every token registered at that moment; the pipeline checks its
+# token between pages, DOCX/TXT chunks, OCR provider calls and LLM calls. Tokens
+# are thread-safe because extraction, local OCR and LLM calls run in worker threads.
+
+
+class JobCancelled(Exception):
+    """Raised at a checkpoint once the job's document has been cancelled."""
+
+
+class CancelToken:
+    def __init__(self, document_id: str):
+        self.document_id = document_id
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled(f"Processing of document {self.document_id} was cancelled")
+
+
+_lock = threading.Lock()
+_tokens: Dict[str, List[CancelToken]] = {}
+
+
+def register(document_id) -> CancelToken:
+    token = CancelToken(str(document_id))
+    with _lock:
+        _tokens.setdefault(token.document_id, []).append(token)
+    return token
+
+
+def release(token: CancelToken):
+    with _lock:
+        tokens = _tokens.get(token.document_id, [])
+        if token in tokens:
+            tokens.remove(token)
+        if not tokens:
+            _tokens.pop(token.document_id, None)
+
+
+def cancel(document_id) -> int:
+    """Cancels every in-flight run of `document_id`; returns how many were signalled."""
+    with _lock:
+        tokens = list(_tokens.get(str(document_id), []))
+    for token in tokens:
+        token.cancel()
+    return len(tokens)
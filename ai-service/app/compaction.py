@@ -0,0 +1,150 @@
+import math
+import re
+from typing import Dict, List
+
+# --- Extractive prompt compaction ---
+# Picks the most informative sentences of a document up to a token budget so the
+# LLM prompt is spent on substantive content instead of cover pages, tables of
+# contents and OCR noise.
+
+CHARS_PER_TOKEN = 4
+_MAX_UNIT_CHARS = 400  # Longest run of wrapped lines joined into one unit
+
+_STOPWORDS = {
+    "the","and","for","that","with","this","from","into","your","have","will","must","should",
+    "are","was","were","is","of","to","in","on","by","it","as","be","or","an","a","at","we",
+    "you","they","their","our","not","no","but","if","than","then","there","here","which",
+    "these","those","such","also","can","may","been","has","had","its","all","any","each",
+}
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+_WORD = re.compile(r"[A-Za-z]+(?:[-’'][A-Za-z]+)*")
+_TOC_LINE = re.compile(r"(\.{3,}|…{2,}|\s{2,}[-_.·]{3,})\s*\d+\s*$")
+_PAGE_NUMBER = re.compile(r"^\s*(page\s*)?\d+(\s*(of|/)\s*\d+)?\s*$", re.IGNORECASE)
+
+
+def _is_furniture(line: str) -> bool:
+    """Page numbers and dot-leader TOC entries; safe to drop line by line."""
+    return bool(_PAGE_NUMBER.match(line) or _TOC_LINE.search(line))
+
+
+def _is_noise(unit: str) -> bool:
+    letters = sum(1 for c in unit if c.isalpha())
+    visible = sum(1 for c in unit if not c.isspace())
+    if not visible or letters / visible < 0.5:
+        return True
+    return len(_WORD.findall(unit)) < 2
+
+
+def _join_wrapped(text: str) -> List[str]:
+    """
+    Re-joins lines wrapped mid-sentence into units. Short lines without terminal
+    punctuation (headings, running headers) stay as their own unit, and runs of
+    unpunctuated lines (tables, code, logs) are cut at _MAX_UNIT_CHARS.
+    """
+    units: List[str] = []
+    buf: List[str] = []
+    size = 0
+    for raw in text.splitlines():
+        ln = " ".join(raw.split())
+        if not ln or _is_furniture(ln):
+            continue
+        buf.append(ln)
+        size += len(ln) + 1
+        if ln.endswith((".", "!", "?", ":")) or len(ln) < 40 or size >= _MAX_UNIT_CHARS:
+            units.append(" ".join(buf))
+            buf = []
+            size = 0
+    if buf:
+        units.append(" ".join(buf))
+    return units
+
+
+def _clean_units(units: List[str]) -> List[str]:
+    """Drops running headers/footers, OCR garbage and duplicates from joined units."""
+    counts: Dict[str, int] = {}
+    for u in units:
+        key = u.lower()
+        counts[key] = counts.get(key, 0) + 1
+    seen = set()
+    cleaned: List[str] = []
+    for u in units:
+        key = u.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        # Running headers/footers: short, unpunctuated and repeated on many pages
+        if counts[key] >= 3 and len(u) < 80 and not u.endswith((".", "!", "?")):
+            continue
+        if _is_noise(u):
+            continue
+        cleaned.append(u)
+    return cleaned
+
+
+def _split_sentences(units: List[str]) -> List[str]:
+    sentences: List[str] = []
+    seen = set()
+    for unit in units:
+        for s in _SENTENCE_SPLIT.split(unit):
+            s = s.strip()
+            key = s.lower()
+            if not s or key in seen:
+                continue
+            seen.add(key)
+            sentences.append(s)
+    return sentences
+
+
+def _terms(sentence: str) -> List[str]:
+    return [w for w in (t.lower() for t in _WORD.findall(sentence)) if w not in _STOPWORDS and len(w) >= 3]
+
+
+def _score_sentences(sentences: List[str]) -> List[float]:
+    """TF-IDF score per sentence, length-normalised so long run-ons don't win by size."""
+    term_lists = [_terms(s) for s in sentences]
+    df: Dict[str, int] = {}
+    for terms in term_lists:
+        for t in set(terms):
+            df[t] = df.get(t, 0) + 1
+    n = len(sentences)
+    scores: List[float] = []
+    for terms in term_lists:
+        if not terms:
+            scores.append(0.0)
+            continue
+        tf: Dict[str, int] = {}
+        for t in terms:
+            tf[t] = tf.get(t, 0) + 1
+        total = sum((1 + math.log(c)) * math.log(1 + n / df[t]) for t, c in tf.items())
+        scores.append(total / math.sqrt(len(terms)))
+    return scores
+
+
+def compact_text(text: str, max_tokens: int) -> str:
+    """Returns the most informative sentences of `text`, in document order, within `max_tokens`."""
+    budget = max(0, max_tokens) * CHARS_PER_TOKEN
+    if not text or budget <= 0:
+        return ""
+    if len(text) <= budget:
+        return text
+    units = _clean_units(_join_wrapped(text))
+    cleaned = "\n".join(units)
+    if not cleaned:
+        return text[:budget]
+    if len(cleaned) <= budget:
+        return cleaned
+    sentences = _split_sentences(units)
+    scores = _score_sentences(sentences)
+    ranked = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+    chosen: List[int] = []
+    used = 0
+    for i in ranked:
+        cost = len(sentences[i]) + 1
+        if used + cost > budget:
+            continue
+        chosen.append(i)
+        used += cost
+    if not chosen:
+        return sentences[ranked[0]][:budget] if ranked else cleaned[:budget]
+    return "\n".join(sentences[i] for i in sorted(chosen))
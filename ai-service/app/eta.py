@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+# --- Stage timing history, ETA estimation and per-job deadlines ---
+ETA_TIMINGS_PATH = os.environ.get("ETA_TIMINGS_PATH", os.path.join(os.path.dirname(__file__), "..", "stage_timings.jsonl"))
+ETA_HISTORY_LIMIT = int(os.environ.get("ETA_HISTORY_LIMIT", "2000"))
+ETA_MIN_SAMPLES = int(os.environ.get("ETA_MIN_SAMPLES", "8"))
+JOB_DEADLINE_SECONDS = float(os.environ.get("JOB_DEADLINE_SECONDS", "600"))  # Hard cap; 0 disables deadlines
+JOB_DEADLINE_MIN_SECONDS = float(os.environ.get("JOB_DEADLINE_MIN_SECONDS", "90"))
+JOB_DEADLINE_FACTOR = float(os.environ.get("JOB_DEADLINE_FACTOR", "3"))
+DEADLINE_RESERVE_SECONDS = float(os.environ.get("DEADLINE_RESERVE_SECONDS", "5"))  # Kept back for the callback
+
+# Cold-start estimates used until a stage has ETA_MIN_SAMPLES recorded runs:
+# (base seconds, seconds per page, seconds per MB)
+_DEFAULT_STAGE_COST: Dict[str, Tuple[float, float, float]] = {
+    "download": (0.5, 0.0, 0.05),
+    "extract": (1.0, 0.1, 0.5),
+    "ocr_providers": (10.0, 1.0, 2.0),
+    "ocr_local_images": (2.0, 2.0, 0.0),
+    "ocr_raster": (2.0, 3.0, 0.0),
+    "ocr_local_image": (3.0, 0.0, 2.0),
+    "llm_gemini": (10.0, 0.0, 0.0),
+    "llm_ollama": (30.0, 0.0, 0.0),
+    "llm_fallback": (0.1, 0.0, 0.0),
+    "callback": (1.0, 0.0, 0.0),
+}
+_RIDGE = 1e-3
+
+
+def _vector(features: Dict) -> List[float]:
+    pages = float(features.get("page_count") or 0)
+    text_ratio = features.get("text_ratio")
+    text_ratio = 1.0 if text_ratio is None else float(text_ratio)
+    return [1.0, float(features.get("size_mb") or 0.0), pages, pages * (1.0 - text_ratio)]
+
+
+def _solve(a: List[List[float]], b: List[float]) -> Optional[List[float]]:
+    # Gaussian elimination with partial pivoting on the small normal-equation system
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12:
+            return None
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(n):
+            if r != col:
+                f = m[r][col] / m[col][col]
+                for c in range(col, n + 1):
+                    m[r][c] -= f * m[col][c]
+    return [m[i][n] / m[i][i] for i in range(n)]
+
+
+def _fit(samples: Iterable[Tuple[List[float], float]]) -> Optional[List[float]]:
+    """Ridge least squares of stage seconds on the feature vector."""
+    size = 4
+    xtx = [[0.0] * size for _ in range(size)]
+    xty = [0.0] * size
+    for x, y in samples:
+        for i in range(size):
+            xty[i] += x[i] * y
+            for j in range(size):
+                xtx[i][j] += x[i] * x[j]
+    for i in range(size):
+        xtx[i][i] += _RIDGE
+    return _solve(xtx, xty)
+
+
+class StageEstimator:
+    """
+    Predicts per-stage durations from recorded timings, keyed by stage name
+    (which encodes the provider/model, e.g. llm_gemini) and file type.
+    """
+
+    def __init__(self, path: str = ETA_TIMINGS_PATH, limit: int = ETA_HISTORY_LIMIT):
+        self.path = path
+        self.limit = limit
+        self._records: Deque[Dict] = deque(maxlen=limit)
+        self._models: Dict[Tuple[str, str], Optional[List[float]]] = {}
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()  # Serialises appends and rewrites of the history file
+        self._loaded = False
+        self._file_lines = 0
+
+    def load(self):
+        """Reads the history file; blocking, so call it from a worker thread at startup."""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._file_lines += 1
+                    try:
+                        self._records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Failed to load stage timings from {self.path}: {e}")
+
+    def _rewrite(self, entries: List[Dict]):
+        # Keep the file at the in-memory history; older lines are never read again
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def record(self, features: Dict, stage_timings: Dict[str, float]):
+        """
+        Appends one job's timings to the history file and the in-memory model.
+        Pass only stages that ran to completion; blocking, so call it from a worker thread.
+        """
+        if not stage_timings:
+            return
+        entry = {"features": features, "stages": stage_timings}
+        # Disk I/O happens outside self._lock so predict() on the event loop never waits on it;
+        # the file lock keeps the file in the same order as the in-memory history
+        with self._file_lock:
+            with self._lock:
+                self._load()
+                self._records.append(entry)
+                self._models.clear()
+                compact = self._file_lines + 1 > 2 * self.limit
+                snapshot = list(self._records) if compact else None
+                self._file_lines = len(self._records) if compact else self._file_lines + 1
+            try:
+                if snapshot is not None:
+                    self._rewrite(snapshot)
+                else:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry) + "\n")
+            except Exception as e:
+                logging.error(f"Failed to record stage timings: {e}")
+
+    def _model(self, stage: str, file_type: str) -> Optional[List[float]]:
+        key = (stage, file_type)
+        if key not in self._models:
+            samples = [
+                (_vector(r["features"]), float(r["stages"][stage]))
+                for r in self._records
+                if stage in r.get("stages", {}) and r.get("features", {}).get("file_type") == file_type
+            ]
+            self._models[key] = _fit(samples) if len(samples) >= ETA_MIN_SAMPLES else None
+        return self._models[key]
+
+    def trained(self, stage: str, features: Dict) -> bool:
+        """True once `stage` has ETA_MIN_SAMPLES recorded runs for this file type."""
+        with self._lock:
+            self._load()
+            return self._model(stage, str(features.get("file_type"))) is not None
+
+    def predict(self, stage: str, features: Dict) -> float:
+        with self._lock:
+            self._load()
+            coef = self._model(stage, str(features.get("file_type")))
+        x = _vector(features)
+        if coef is not None:
+            return max(0.0, sum(c * v for c, v in zip(coef, x)))
+        base, per_page, per_mb = _DEFAULT_STAGE_COST.get(stage, (1.0, 0.0, 0.0))
+        return base + per_page * x[2] + per_mb * x[1]
+
+    def remaining(self, features: Dict, stages: Iterable[str]) -> int:
+        """Seconds expected for the given not-yet-finished stages."""
+        return int(round(sum(self.predict(s, features) for s in stages)))
+
+
+class Deadline:
+    """Wall-clock budget for one job; `remaining()` is None when deadlines are disabled."""
+
+    def __init__(self, budget_seconds: float, started_at: Optional[float] = None):
+        self.budget = budget_seconds
+        start = time.monotonic() if started_at is None else started_at
+        self._expires = start + budget_seconds if budget_seconds > 0 else None
+
+    @classmethod
+    def for_job(cls, predicted_seconds: float, started_at: Optional[float] = None) -> "Deadline":
+        """Allows JOB_DEADLINE_FACTOR times the predicted duration, within the min/max bounds."""
+        if JOB_DEADLINE_SECONDS <= 0:
+            return cls(0)
+        budget = max(JOB_DEADLINE_MIN_SECONDS, JOB_DEADLINE_FACTOR * predicted_seconds)
+        return cls(min(budget, JOB_DEADLINE_SECONDS), started_at)
+
+    @property
+    def expires_at(self) -> Optional[float]:
+        return self._expires
+
+    def remaining(self) -> Optional[float]:
+        if self._expires is None:
+            return None
+        return max(0.0, self._expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return self._expires is not None and time.monotonic() >= self._expires
+
+
+estimator = StageEstimator()
@@ -0,0 +1,158 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# --- Non-blocking logging ---
+# Records are truncated and rate limited on the calling thread, then handed to a
+# bounded queue; a background listener does the formatting and disk writes.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()  # "text" or "json"
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_FIELD_CHARS = int(os.environ.get("LOG_MAX_FIELD_CHARS", "2000"))
+LOG_MAX_TRACEBACK_CHARS = int(os.environ.get("LOG_MAX_TRACEBACK_CHARS", "4000"))
+LOG_RATE_LIMIT_WINDOW = float(os.environ.get("LOG_RATE_LIMIT_WINDOW", "60"))
+LOG_RATE_LIMIT_BURST = int(os.environ.get("LOG_RATE_LIMIT_BURST", "5"))
+
+_TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+_VARIABLE_PARTS = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F-]{27}|\d+")
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _truncate(value: str, limit: int) -> str:
+    if limit <= 0 or len(value) <= limit:
+        return value
+    return f"{value[:limit]}... [truncated {len(value) - limit} chars]"
+
+
+class _RateLimitFilter(logging.Filter):
+    """Lets through at most LOG_RATE_LIMIT_BURST similar warnings/errors per window."""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        # key -> (window start, count, suppressed)
+        self._windows: Dict[Tuple[str, int, str], Tuple[float, int, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or LOG_RATE_LIMIT_BURST <= 0:
+            return True
+        key = (record.name, record.levelno, _VARIABLE_PARTS.sub("#", str(record.msg)[:200]))
+        now = time.monotonic()
+        with self._lock:
+            start, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - start >= LOG_RATE_LIMIT_WINDOW:
+                if suppressed:
+                    record.suppressed = suppressed
+                start, count, suppressed = now, 0, 0
+            if count >= LOG_RATE_LIMIT_BURST:
+                self._windows[key] = (start, count, suppressed + 1)
+                return False
+            self._windows[key] = (start, count + 1, suppressed)
+            if len(self._windows) > 10000:
+                self._windows.clear()
+        return True
+
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that truncates records and drops them when the queue is full.
+    The number of dropped records is reported as a warning once the queue has
+    room again, at most once per LOG_RATE_LIMIT_WINDOW.
+    """
+
+    dropped = 0
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self._drop_lock = threading.Lock()
+        self._last_drop_report = 0.0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Work on a copy; other root handlers still need the original message and exc_info.
+        record = copy.copy(record)
+        message = _truncate(record.getMessage(), LOG_MAX_FIELD_CHARS)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            message += f" [suppressed {suppressed} similar messages]"
+        if record.exc_info:
+            tb = logging.Formatter().formatException(record.exc_info)
+            # Keep the tail; the innermost frames and the exception line matter most.
+            if len(tb) > LOG_MAX_TRACEBACK_CHARS > 0:
+                tb = f"[truncated {len(tb) - LOG_MAX_TRACEBACK_CHARS} chars]...{tb[-LOG_MAX_TRACEBACK_CHARS:]}"
+            record.exc_text = tb
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                _BoundedQueueHandler.dropped += 1
+            return
+        if _BoundedQueueHandler.dropped:
+            self._report_dropped()
+
+    def _report_dropped(self):
+        now = time.monotonic()
+        with self._drop_lock:
+            if not _BoundedQueueHandler.dropped or now - self._last_drop_report < LOG_RATE_LIMIT_WINDOW:
+                return
+            count, _BoundedQueueHandler.dropped = _BoundedQueueHandler.dropped, 0
+            self._last_drop_report = now
+        notice = logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0,
+            f"Log queue was full; dropped {count} log records", None, None,
+        )
+        try:
+            self.queue.put_nowait(notice)
+        except queue.Full:
+            with self._drop_lock:
+                _BoundedQueueHandler.dropped += count
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["traceback"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(log_file_path: str):
+    """Routes the root logger through a bounded queue to a rotating file handler."""
+    global _listener
+    if _listener is not None:
+        return
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True
+    )
+    file_handler.setFormatter(_JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(_TEXT_FORMAT))
+
+    queue_handler = _BoundedQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    queue_handler.addFilter(_RateLimitFilter())
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,32 +1,100 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, Request, Header
+from fastapi.responses import FileResponse
 import os
+import asyncio
 import httpx # For making the callback to Laravel for status updates
-from .models import ProcessRequest
-from .services import process_document_logic
+from .models import ProcessRequest, CancelRequest
+from .services import process_document_logic, estimate_document_cost
+from .scheduler import scheduler, choose_lane
+from .eta import estimator
+from .profiling import list_profiles, profile_file_path
+from . import cancellation
 
 app = FastAPI()
 
 # --- Configuration ---
 AI_SERVICE_SECRET = os.environ.get("AI_SERVICE_SECRET", "supersecretkey123") # Shared secret for internal communication
 
+@app.on_event("startup")
+async def load_stage_timings():
+    # Read the ETA history once in a worker thread rather than on the first estimate
+    await asyncio.to_thread(estimator.load)
+
 @app.post("/process-document")
-async def process_document_endpoint(request: ProcessRequest, background_tasks: BackgroundTasks):
+async def process_document_endpoint(request: ProcessRequest):
     """
-    Receives a request to process a document, dispatches it to a background task,
-    and immediately returns a response.
+    Receives a request to process a document, queues it in a scheduling lane
+    chosen by its estimated cost, and immediately returns a response.
     """
     # 1. Authenticate the request from Laravel
     if request.secret != AI_SERVICE_SECRET:
         raise HTTPException(status_code=403, detail="Unauthorized: Invalid secret")
 
-    # 2. Run the heavy processing in the background
-    background_tasks.add_task(
-        process_document_logic,
-        document_id=request.document_id,
-        file_path=request.file_path
+    # 2. A new submission supersedes any run still in flight for the same document (e.g. a retry)
+    _cancel_document(str(request.document_id))
+
+    # 3. Estimate the job's cost and queue the heavy processing in its lane
+    estimate = await asyncio.to_thread(estimate_document_cost, request.file_path)
+    lane = choose_lane(estimate["needs_ocr"], estimate["pre_llm_seconds"])
+    scheduler.submit(
+        lane,
+        str(request.document_id),
+        estimate["estimated_seconds"],
+        lambda: process_document_logic(
+            document_id=request.document_id,
+            file_path=request.file_path,
+            profile=request.profile
+        ),
     )
     
-    return {"message": "Document processing initiated.", "document_id": request.document_id}
+    return {
+        "message": "Document processing initiated.",
+        "document_id": request.document_id,
+        "lane": lane,
+        "estimated_seconds": estimate["estimated_seconds"],
+    }
+
+def _cancel_document(document_id: str) -> dict:
+    result = scheduler.cancel(document_id)
+    result["signalled"] = cancellation.cancel(document_id)
+    return result
+
+@app.post("/cancel-document")
+async def cancel_document_endpoint(request: CancelRequest):
+    """
+    Cancels queued and in-flight processing for a document. Running jobs stop at
+    their next checkpoint (between pages, OCR provider calls or LLM calls) and
+    clean up their temp files without calling back to Laravel.
+    """
+    if request.secret != AI_SERVICE_SECRET:
+        raise HTTPException(status_code=403, detail="Unauthorized: Invalid secret")
+    result = _cancel_document(str(request.document_id))
+    return {"document_id": request.document_id, **result}
+
+def _check_internal_secret(secret: str):
+    if secret != AI_SERVICE_SECRET:
+        raise HTTPException(status_code=403, detail="Unauthorized: Invalid secret")
+
+@app.get("/lanes")
+async def lanes_endpoint(x_internal_secret: str = Header("")):
+    """Reports running and queued jobs per scheduling lane."""
+    _check_internal_secret(x_internal_secret)
+    return {"lanes": scheduler.snapshot()}
+
+@app.get("/profiles")
+async def list_profiles_endpoint(x_internal_secret: str = Header("")):
+    """Lists captured job profiles, newest first."""
+    _check_internal_secret(x_internal_secret)
+    return {"profiles": list_profiles()}
+
+@app.get("/profiles/{filename}")
+async def download_profile_endpoint(filename: str, x_internal_secret: str = Header("")):
+    """Downloads one profile artifact (.prof, .tracemalloc or .json)."""
+    _check_internal_secret(x_internal_secret)
+    path = profile_file_path(filename)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=filename)
 
 @app.get("/")
 async def root():
@@ -6,6 +6,11 @@ class ProcessRequest(BaseModel):
     secret: str
     document_id: uuid.UUID
     file_path: str # Path within Supabase Storage
+    profile: bool = False # Capture a CPU/memory profile for this job
+
+class CancelRequest(BaseModel):
+    secret: str
+    document_id: uuid.UUID
 
 class ChoiceData(BaseModel):
     choice_text: str
@@ -0,0 +1,181 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+# --- On-demand per-job profiling ---
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "..", "profiles"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0") or 0)
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "40"))
+
+# cProfile and tracemalloc are process-wide, so only one job is captured at a time.
+_active_lock = threading.Lock()
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def should_profile(requested: bool) -> bool:
+    return bool(requested) or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+
+
+class JobProfiler:
+    """
+    Captures a CPU profile and a tracemalloc snapshot around one processing job.
+    Jobs share the event loop, so the CPU profile also includes whatever other
+    tasks ran while this one was awaiting; the stage timings are per-job. Work
+    the job hands to worker threads is only included when run through `wrap`.
+    """
+
+    def __init__(self, document_id: str):
+        self.document_id = str(document_id)
+        self._profiler: Optional[cProfile.Profile] = None
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._thread_lock = threading.Lock()
+        self._started_tracemalloc = False
+        self._start = 0.0
+        self._wall = 0.0
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._peak: Optional[int] = None
+
+    @classmethod
+    def start(cls, document_id) -> Optional["JobProfiler"]:
+        if not _active_lock.acquire(blocking=False):
+            logging.info(f"Profiling skipped for {document_id}: another job is being profiled")
+            return None
+        prof = cls(document_id)
+        try:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                prof._started_tracemalloc = True
+            prof._profiler = cProfile.Profile()
+            prof._profiler.enable()
+            prof._start = time.perf_counter()
+            return prof
+        except Exception as e:
+            logging.error(f"Failed to start profiling for {document_id}: {e}")
+            prof._release()
+            return None
+
+    def wrap(self, fn: Callable) -> Callable:
+        """Returns `fn` profiled into this job's CPU profile, for running in a worker thread."""
+        def run(*args, **kwargs):
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError:
+                # Python 3.12+ allows one active profiler, and the job's already sees every thread
+                return fn(*args, **kwargs)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                prof.disable()
+                with self._thread_lock:
+                    self._thread_profiles.append(prof)
+        return run
+
+    def _stats(self, stream) -> pstats.Stats:
+        stats = pstats.Stats(self._profiler, stream=stream)
+        with self._thread_lock:
+            thread_profiles = list(self._thread_profiles)
+        for prof in thread_profiles:
+            stats.add(prof)
+        return stats
+
+    def _release(self):
+        if self._started_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        _active_lock.release()
+
+    def stop(self):
+        """
+        Disables the profilers and takes the tracemalloc snapshot. Cheap enough for
+        the event loop; frees the profiling slot for the next job. Call `write` after.
+        """
+        try:
+            if self._profiler:
+                self._profiler.disable()
+            self._wall = time.perf_counter() - self._start
+            if tracemalloc.is_tracing():
+                self._snapshot = tracemalloc.take_snapshot()
+                self._peak = tracemalloc.get_traced_memory()[1]
+        except Exception as e:
+            logging.error(f"Failed to stop profiling for {self.document_id}: {e}")
+        finally:
+            self._release()
+
+    def write(self, metadata: Dict):
+        """
+        Writes `<prefix>.prof`, `<prefix>.tracemalloc` and `<prefix>.json` to PROFILE_DIR.
+        Sorting and dumping can take seconds for large jobs, so run it in a worker thread.
+        """
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+            prefix = os.path.join(PROFILE_DIR, f"{stamp}_{self.document_id}")
+            top_functions = ""
+            if self._profiler:
+                buf = io.StringIO()
+                stats = self._stats(buf)
+                stats.dump_stats(prefix + ".prof")
+                stats.sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+                top_functions = buf.getvalue()
+            top_allocations: List[str] = []
+            if self._snapshot:
+                self._snapshot.dump(prefix + ".tracemalloc")
+                top_allocations = [str(s) for s in self._snapshot.statistics("lineno")[:PROFILE_TOP_N]]
+            info = dict(metadata)
+            info.update({
+                "document_id": self.document_id,
+                "captured_at": stamp,
+                "wall_seconds": round(self._wall, 4),
+                "peak_traced_bytes": self._peak,
+                "top_functions": top_functions,
+                "top_allocations": top_allocations,
+            })
+            with open(prefix + ".json", "w", encoding="utf-8") as f:
+                json.dump(info, f, indent=2, default=str)
+            logging.info(f"Wrote profile for {self.document_id} to {prefix}.*")
+        except Exception as e:
+            logging.error(f"Failed to write profile for {self.document_id}: {e}")
+
+
+def list_profiles() -> List[Dict]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    entries: List[Dict] = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        base = name[:-len(".json")]
+        try:
+            with open(os.path.join(PROFILE_DIR, name), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except Exception:
+            continue
+        files = [n for n in (base + ".prof", base + ".tracemalloc", name) if os.path.exists(os.path.join(PROFILE_DIR, n))]
+        entries.append({
+            "id": base,
+            "document_id": meta.get("document_id"),
+            "file_type": meta.get("file_type"),
+            "page_count": meta.get("page_count"),
+            "wall_seconds": meta.get("wall_seconds"),
+            "stage_timings": meta.get("stage_timings"),
+            "files": files,
+        })
+    return entries
+
+
+def profile_file_path(filename: str) -> Optional[str]:
+    """Resolves a profile artifact by file name, refusing anything outside PROFILE_DIR."""
+    if not _SAFE_NAME.match(filename or ""):
+        return None
+    path = os.path.join(PROFILE_DIR, filename)
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,112 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# --- Cost-aware scheduling lanes ---
+# Jobs are routed to a lane by their estimated cost; each lane has its own
+# concurrency limit and runs the cheapest waiting job first, with an aging bonus
+# so large jobs are not starved by a steady stream of small ones.
+LANE_CONCURRENCY = {
+    "text": int(os.environ.get("LANE_TEXT_CONCURRENCY", "4")),
+    "large": int(os.environ.get("LANE_LARGE_CONCURRENCY", "2")),
+    "ocr": int(os.environ.get("LANE_OCR_CONCURRENCY", "1")),
+}
+LANE_TEXT_MAX_SECONDS = float(os.environ.get("LANE_TEXT_MAX_SECONDS", "20"))
+LANE_AGING_FACTOR = float(os.environ.get("LANE_AGING_FACTOR", "0.5"))  # Estimated seconds forgiven per second waited
+
+
+@dataclass
+class QueuedJob:
+    key: str
+    cost: float
+    run: Callable[[], Awaitable[None]]
+    seq: int
+    enqueued_at: float = field(default_factory=time.monotonic)
+    task: Optional[asyncio.Task] = None
+
+    def priority(self, now: float):
+        return (self.cost - LANE_AGING_FACTOR * (now - self.enqueued_at), self.seq)
+
+
+class Lane:
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.pending: List[QueuedJob] = []
+        self.running: Dict[int, QueuedJob] = {}
+
+    def submit(self, job: QueuedJob):
+        self.pending.append(job)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.pending and len(self.running) < self.concurrency:
+            now = time.monotonic()
+            job = min(self.pending, key=lambda j: j.priority(now))
+            self.pending.remove(job)
+            logging.info(f"Lane {self.name}: starting {job.key} (est {job.cost:.1f}s, waited {now - job.enqueued_at:.1f}s)")
+            self.running[job.seq] = job
+            job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: QueuedJob):
+        try:
+            await job.run()
+        except asyncio.CancelledError:
+            logging.info(f"Lane {self.name}: job {job.key} cancelled")
+        except Exception as e:
+            logging.error(f"Lane {self.name}: job {job.key} failed: {e}", exc_info=True)
+        finally:
+            self.running.pop(job.seq, None)
+            self._dispatch()
+
+    def cancel(self, key: str) -> Dict[str, int]:
+        """Drops queued jobs for `key` and cancels its running tasks."""
+        dropped = [j for j in self.pending if j.key == key]
+        for job in dropped:
+            self.pending.remove(job)
+        running = [j for j in self.running.values() if j.key == key and j.task]
+        for job in running:
+            job.task.cancel()
+        return {"dequeued": len(dropped), "running": len(running)}
+
+    def snapshot(self) -> Dict:
+        return {"concurrency": self.concurrency, "running": len(self.running), "queued": len(self.pending)}
+
+
+class LaneScheduler:
+    def __init__(self):
+        self.lanes = {name: Lane(name, c) for name, c in LANE_CONCURRENCY.items()}
+        self._seq = itertools.count()
+
+    def submit(self, lane: str, key: str, cost: float, run: Callable[[], Awaitable[None]]):
+        """Queues `run` in `lane`; must be called from the event loop."""
+        self.lanes[lane].submit(QueuedJob(key=key, cost=cost, run=run, seq=next(self._seq)))
+
+    def cancel(self, key: str) -> Dict[str, int]:
+        totals = {"dequeued": 0, "running": 0}
+        for lane in self.lanes.values():
+            for k, v in lane.cancel(key).items():
+                totals[k] += v
+        return totals
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: lane.snapshot() for name, lane in self.lanes.items()}
+
+
+def choose_lane(needs_ocr: bool, pre_llm_seconds: float) -> str:
+    """
+    Routes on the work before the LLM call, which every job then shares. Jobs
+    predicted to finish it within LANE_TEXT_MAX_SECONDS go to `text`, whatever
+    their type, so a small photo never queues behind a long scan. Slower jobs go
+    to `ocr` if they need OCR and to `large` otherwise.
+    """
+    if pre_llm_seconds <= LANE_TEXT_MAX_SECONDS:
+        return "text"
+    return "ocr" if needs_ocr else "large"
+
+
+scheduler = LaneScheduler()
@@ -1,10 +1,16 @@
 import httpx
 import os
 from dotenv import load_dotenv
+import io
 import json
 import uuid
 import asyncio
-from typing import List, Dict
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import List, Dict, Optional
 
 # External libraries for text extraction
 import pytesseract
@@ -19,6 +25,12 @@ except Exception:
 
 # Internal models
 from .models import QuestionData, ChoiceData, AICallbackPayload
+from .compaction import compact_text
+from .text_formats import iter_docx_text, read_text_file
+from .profiling import JobProfiler, should_profile
+from .eta import Deadline, DEADLINE_RESERVE_SECONDS, estimator
+from . import cancellation
+from .cancellation import CancelToken, JobCancelled
 import re
 import random
 
@@ -37,6 +49,7 @@ SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXV
 TESSERACT_PATH = os.environ.get("TESSERACT_PATH")
 OCR_PROVIDER = os.environ.get("OCR_PROVIDER")  # e.g., "ocrspace"
 OCRSPACE_API_KEY = os.environ.get("OCRSPACE_API_KEY")
+OCRSPACE_API_URL = os.environ.get("OCRSPACE_API_URL", "https://api.ocr.space/parse/image")
 OCR_CHAIN = [p.strip() for p in os.environ.get("OCR_CHAIN", "").split(",") if p.strip()]
 T3XTR_API_URL = os.environ.get("T3XTR_API_URL")
 T3XTR_API_KEY = os.environ.get("T3XTR_API_KEY")
@@ -92,11 +105,11 @@ def _ensure_tesseract_cmd():
 _ensure_tesseract_cmd()
 
 import logging
-import traceback
+from .logging_setup import configure_logging
 
 # Create a logger
 log_file_path = os.path.join(os.path.dirname(__file__), "..", "ai_service.log")
-logging.basicConfig(filename=log_file_path, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging(log_file_path)
 
 # --- Helper Functions for Text Extraction ---
 
@@ -111,39 +124,52 @@ def _tesseract_available() -> bool:
         return True
     return shutil.which("tesseract") is not None
 
+def _resolve_storage_path(file_path: str) -> Optional[str]:
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+    base_storage_app = os.path.join(repo_root, "backend", "storage", "app")
+    candidates = []
+    candidates.append(os.path.join(base_storage_app, file_path))
+    candidates.append(os.path.join(base_storage_app, "private", file_path))
+    if file_path.startswith("public/"):
+        rel = file_path.split("public/", 1)[1]
+        candidates.append(os.path.join(base_storage_app, "public", rel))
+    for sp in candidates:
+        if os.path.exists(sp):
+            return sp
+    return None
+
 def _download_file_from_supabase(file_path: str, local_path: str):
     try:
-        repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-        base_storage_app = os.path.join(repo_root, "backend", "storage", "app")
-        candidates = []
-        candidates.append(os.path.join(base_storage_app, file_path))
-        candidates.append(os.path.join(base_storage_app, "private", file_path))
-        if file_path.startswith("public/"):
-            rel = file_path.split("public/", 1)[1]
-            candidates.append(os.path.join(base_storage_app, "public", rel))
-        for sp in candidates:
-            if os.path.exists(sp):
-                shutil.copy2(sp, local_path)
-                logging.info(f"Copied '{sp}' to '{local_path}'")
-                return
+        sp = _resolve_storage_path(file_path)
+        if sp:
+            shutil.copy2(sp, local_path)
+            logging.info(f"Copied '{sp}' to '{local_path}'")
+            return
         raise FileNotFoundError(f"Source file not found for '{file_path}' in storage app/private/public")
     except Exception as e:
-        logging.error(f"Failed to download file: {e}")
-        logging.error(traceback.format_exc())
+        logging.error(f"Failed to download file: {e}", exc_info=True)
         raise
 
 
-def _extract_text_from_pdf(file_path: str) -> str:
+def _extract_text_from_pdf(file_path: str, stats: Optional[Dict] = None, cancel_token: Optional[CancelToken] = None) -> str:
     try:
         reader = PdfReader(file_path, strict=False)
         text = ""
+        text_pages = 0
         for page in reader.pages:
+            if cancel_token and cancel_token.cancelled:
+                break
             try:
                 page_text = page.extract_text() or ""
             except Exception:
                 page_text = ""
+            if page_text.strip():
+                text_pages += 1
             text += page_text + "\n"
-        if PDFMINER_AVAILABLE:
+        if stats is not None:
+            stats["page_count"] = len(reader.pages)
+            stats["text_ratio"] = round(text_pages / len(reader.pages), 3) if len(reader.pages) else 0.0
+        if PDFMINER_AVAILABLE and not (cancel_token and cancel_token.cancelled):
             try:
                 if not text.strip() or len(text.strip()) < 80:
                     alt = pdfminer_extract_text(file_path) or ""
@@ -153,9 +179,25 @@ def _extract_text_from_pdf(file_path: str) -> str:
                 pass
         return text
     except Exception as e:
-        logging.error(f"PDF text extraction failed: {e}")
-        logging.error(traceback.format_exc())
+        logging.error(f"PDF text extraction failed: {e}", exc_info=True)
         return ""
+def _probe_pdf(file_path: str, sample_pages: int = 3) -> Dict:
+    """Cheap page count and text-layer check on the first few pages."""
+    try:
+        reader = PdfReader(file_path, strict=False)
+        pages = len(reader.pages)
+        sampled = min(pages, sample_pages)
+        with_text = 0
+        for i in range(sampled):
+            try:
+                if (reader.pages[i].extract_text() or "").strip():
+                    with_text += 1
+            except Exception:
+                pass
+        return {"page_count": pages, "text_ratio": round(with_text / sampled, 3) if sampled else 0.0}
+    except Exception:
+        return {"page_count": None, "text_ratio": None}
+
 def _extract_text_from_pdf_metadata(file_path: str) -> str:
     try:
         reader = PdfReader(file_path, strict=False)
@@ -180,11 +222,27 @@ def _extract_text_from_pdf_metadata(file_path: str) -> str:
     except Exception:
         return ""
 
-def _extract_text_from_pdf_images(file_path: str) -> str:
+def _preprocess_for_ocr(im: Image.Image) -> Image.Image:
+    try:
+        from PIL import ImageOps, ImageFilter
+        if im.mode != "L":
+            im = ImageOps.grayscale(im)
+        im = ImageOps.autocontrast(im)
+        im = im.filter(ImageFilter.SHARPEN)
+    except Exception:
+        pass
+    return im
+
+def _extract_text_from_pdf_images(file_path: str, deadline: Optional[Deadline] = None, cancel_token: Optional[CancelToken] = None) -> str:
     texts: List[str] = []
     try:
         reader = PdfReader(file_path, strict=False)
         for page in reader.pages:
+            if cancel_token and cancel_token.cancelled:
+                break
+            if deadline and deadline.expired():
+                logging.warning(f"Deadline reached during embedded image OCR; keeping {len(texts)} results")
+                break
             try:
                 resources = page.get("/Resources")
                 if not resources:
@@ -215,31 +273,12 @@ def _extract_text_from_pdf_images(file_path: str) -> str:
                             data = getattr(img, "_data", None)
                         if not data:
                             continue
-                        ext = None
-                        if filt == "/DCTDecode":
-                            ext = "jpg"
-                        elif filt == "/JPXDecode":
-                            ext = "jp2"
-                        if not ext:
+                        # Only JPEG / JPEG 2000 streams are self-contained images Pillow can decode
+                        if filt not in ("/DCTDecode", "/JPXDecode"):
                             continue
-                        tmp_path = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4()}.{ext}")
-                        with open(tmp_path, "wb") as f:
-                            f.write(data)
-                        try:
-                            im = Image.open(tmp_path)
-                            try:
-                                from PIL import ImageOps, ImageFilter
-                                im = ImageOps.grayscale(im)
-                                im = ImageOps.autocontrast(im)
-                                im = im.filter(ImageFilter.SHARPEN)
-                            except Exception:
-                                pass
+                        with Image.open(io.BytesIO(data)) as im:
+                            im = _preprocess_for_ocr(im)
                             texts.append(pytesseract.image_to_string(im, config="--psm 6 -l eng"))
-                        finally:
-                            try:
-                                os.remove(tmp_path)
-                            except Exception:
-                                pass
                     except Exception:
                         continue
             except Exception:
@@ -248,7 +287,7 @@ def _extract_text_from_pdf_images(file_path: str) -> str:
         pass
     return "\n".join(texts)
 
-def _ocr_rasterize_pdf_pages(file_path: str) -> str:
+def _ocr_rasterize_pdf_pages(file_path: str, deadline: Optional[Deadline] = None, cancel_token: Optional[CancelToken] = None) -> str:
     try:
         import fitz  # PyMuPDF
     except Exception as e:
@@ -258,26 +297,20 @@ def _ocr_rasterize_pdf_pages(file_path: str) -> str:
     try:
         doc = fitz.open(file_path)
         for i in range(len(doc)):
+            if cancel_token and cancel_token.cancelled:
+                break
+            if deadline and deadline.expired():
+                logging.warning(f"Deadline reached during raster OCR after {i} of {len(doc)} pages")
+                break
             try:
                 page = doc.load_page(i)
-                pix = page.get_pixmap()
-                tmp_path = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4()}.png")
-                pix.save(tmp_path)
-                try:
-                    im = Image.open(tmp_path)
-                    try:
-                        from PIL import ImageOps, ImageFilter
-                        im = ImageOps.grayscale(im)
-                        im = ImageOps.autocontrast(im)
-                        im = im.filter(ImageFilter.SHARPEN)
-                    except Exception:
-                        pass
-                    texts.append(pytesseract.image_to_string(im, config="--psm 6 -l eng"))
-                finally:
-                    try:
-                        os.remove(tmp_path)
-                    except Exception:
-                        pass
+                # Render straight to grayscale and hand the raw samples to Pillow; no PNG round trip
+                pix = page.get_pixmap(colorspace=fitz.csGRAY, alpha=False)
+                samples = getattr(pix, "samples_mv", None) or pix.samples
+                im = Image.frombytes("L", (pix.width, pix.height), samples)
+                pix = None
+                im = _preprocess_for_ocr(im)
+                texts.append(pytesseract.image_to_string(im, config="--psm 6 -l eng"))
             except Exception as e:
                 logging.error(f"Raster OCR page {i} failed: {e}")
                 continue
@@ -286,8 +319,13 @@ def _ocr_rasterize_pdf_pages(file_path: str) -> str:
         logging.error(f"Raster OCR failed: {e}")
         return ""
     return "\n".join(texts)
-def _extract_text_from_docx(file_path: str) -> str:
-    """Extracts text from a DOCX file."""
+
+def _extract_text_from_docx(file_path: str, cancel_token: Optional[CancelToken] = None) -> str:
+    """Extracts text from a DOCX file, including tables, text boxes, notes, headers and footers."""
+    try:
+        return "\n".join(iter_docx_text(file_path, cancel_token))
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        logging.warning(f"Streaming DOCX extraction failed ({e}); falling back to python-docx")
     doc = DocxDocument(file_path)
     text = ""
     for para in doc.paragraphs:
@@ -297,35 +335,38 @@ def _extract_text_from_docx(file_path: str) -> str:
 def _extract_text_from_image(file_path: str) -> str:
     """Extracts text from an image file using OCR (Tesseract)."""
     try:
-        img = Image.open(file_path)
-        try:
+        with Image.open(file_path) as img:
             # Simple pre-processing for better OCR
-            from PIL import ImageOps, ImageFilter
-            img = ImageOps.grayscale(img)
-            img = ImageOps.autocontrast(img)
-            img = img.filter(ImageFilter.SHARPEN)
-        except Exception:
-            pass
-        text = pytesseract.image_to_string(img, config="--psm 6 -l eng")
+            img = _preprocess_for_ocr(img)
+            text = pytesseract.image_to_string(img, config="--psm 6 -l eng")
         return text
     except Exception as e:
         logging.error(f"OCR failed for {file_path}: {e}")
         return ""
 
-async def _ocr_with_ocrspace(file_path: str) -> str:
+OCRSPACE_MAX_BYTES = 5 * 1024 * 1024  # Free tier upload limit
+
+def _upload_bytes(file_path: str, content: Optional[bytes]) -> bytes:
+    # Provider chains read the upload once and share the buffer across providers
+    if content is not None:
+        return content
+    with open(file_path, "rb") as f:
+        return f.read()
+
+async def _ocr_with_ocrspace(file_path: str, content: Optional[bytes] = None) -> str:
     if not OCRSPACE_API_KEY:
         return ""
     try:
-        file_size = os.path.getsize(file_path)
+        file_size = len(content) if content is not None else os.path.getsize(file_path)
         logging.info(f"Attempting OCR with ocr.space for file: {file_path} (Size: {file_size / 1024 / 1024:.2f} MB)")
 
         # Free tier has a 5MB limit, let's check for that.
-        if file_size > 5 * 1024 * 1024:
+        if file_size > OCRSPACE_MAX_BYTES:
             logging.warning("OCR.space: File size exceeds 5MB limit of the free tier. Skipping.")
             # We could optionally try to connect to a different provider here if we had one
             return ""
 
-        url = "https://api.ocr.space/parse/image"
+        url = OCRSPACE_API_URL
         data = {
             "language": "eng",
             "isOverlayRequired": False,
@@ -333,19 +374,18 @@ async def _ocr_with_ocrspace(file_path: str) -> str:
             "scale": True, # Helps with low-res scans
         }
         async with httpx.AsyncClient(timeout=90.0) as client: # Increased timeout for larger files
-            with open(file_path, "rb") as f:
-                files = {"file": (os.path.basename(file_path), f, "application/octet-stream")}
-                headers = {"apikey": OCRSPACE_API_KEY}
+            files = {"file": (os.path.basename(file_path), _upload_bytes(file_path, content), "application/octet-stream")}
+            headers = {"apikey": OCRSPACE_API_KEY}
                 
-                logging.info("Sending request to ocr.space API...")
-                resp = await client.post(url, data=data, files=files, headers=headers)
+            logging.info("Sending request to ocr.space API...")
+            resp = await client.post(url, data=data, files=files, headers=headers)
                 
-                logging.info(f"OCR.space response status code: {resp.status_code}")
-                response_text = resp.text
-                logging.info(f"OCR.space raw response: {response_text}")
+            logging.info(f"OCR.space response status code: {resp.status_code}")
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug(f"OCR.space raw response ({len(resp.content)} bytes): {resp.text[:500]}")
 
-                resp.raise_for_status()
-                payload = resp.json()
+            resp.raise_for_status()
+            payload = resp.json()
 
         if payload.get("IsErroredOnProcessing"):
             logging.error(f"OCR.space API returned an error: {payload.get('ErrorMessage')}")
@@ -364,20 +404,18 @@ async def _ocr_with_ocrspace(file_path: str) -> str:
         logging.warning("OCR.space response did not contain ParsedResults.")
         return ""
     except Exception as e:
-        logging.error(f"OCR.Space request failed with an exception: {e}")
-        logging.error(traceback.format_exc())
+        logging.error(f"OCR.Space request failed with an exception: {e}", exc_info=True)
         return ""
-async def _ocr_with_t3xtr(file_path: str) -> str:
+async def _ocr_with_t3xtr(file_path: str, content: Optional[bytes] = None) -> str:
     if not (T3XTR_API_URL and T3XTR_API_KEY):
         return ""
     try:
         async with httpx.AsyncClient(timeout=60.0) as client:
-            with open(file_path, "rb") as f:
-                files = {"file": (os.path.basename(file_path), f, "application/pdf")}
-                headers = {"Authorization": f"Bearer {T3XTR_API_KEY}"}
-                resp = await client.post(T3XTR_API_URL, files=files, headers=headers)
-                resp.raise_for_status()
-                payload = resp.json()
+            files = {"file": (os.path.basename(file_path), _upload_bytes(file_path, content), "application/pdf")}
+            headers = {"Authorization": f"Bearer {T3XTR_API_KEY}"}
+            resp = await client.post(T3XTR_API_URL, files=files, headers=headers)
+            resp.raise_for_status()
+            payload = resp.json()
         for k in ("text", "data", "result"):
             v = payload.get(k)
             if isinstance(v, str) and v.strip():
@@ -391,17 +429,16 @@ async def _ocr_with_t3xtr(file_path: str) -> str:
     except Exception as e:
         logging.error(f"T3XTR request failed: {e}")
         return ""
-async def _ocr_with_apdf(file_path: str) -> str:
+async def _ocr_with_apdf(file_path: str, content: Optional[bytes] = None) -> str:
     if not (APDF_API_URL and APDF_API_KEY):
         return ""
     try:
         async with httpx.AsyncClient(timeout=60.0) as client:
-            with open(file_path, "rb") as f:
-                files = {"file": (os.path.basename(file_path), f, "application/pdf")}
-                headers = {"Authorization": f"Bearer {APDF_API_KEY}"}
-                resp = await client.post(APDF_API_URL, files=files, headers=headers)
-                resp.raise_for_status()
-                payload = resp.json()
+            files = {"file": (os.path.basename(file_path), _upload_bytes(file_path, content), "application/pdf")}
+            headers = {"Authorization": f"Bearer {APDF_API_KEY}"}
+            resp = await client.post(APDF_API_URL, files=files, headers=headers)
+            resp.raise_for_status()
+            payload = resp.json()
         for k in ("text", "content", "result"):
             v = payload.get(k)
             if isinstance(v, str) and v.strip():
@@ -410,17 +447,16 @@ async def _ocr_with_apdf(file_path: str) -> str:
     except Exception as e:
         logging.error(f"aPDF request failed: {e}")
         return ""
-async def _ocr_with_textmill(file_path: str) -> str:
+async def _ocr_with_textmill(file_path: str, content: Optional[bytes] = None) -> str:
     if not (TEXTMILL_API_URL and TEXTMILL_API_KEY):
         return ""
     try:
         async with httpx.AsyncClient(timeout=60.0) as client:
-            with open(file_path, "rb") as f:
-                files = {"file": (os.path.basename(file_path), f, "application/octet-stream")}
-                headers = {"Authorization": f"Bearer {TEXTMILL_API_KEY}"}
-                resp = await client.post(TEXTMILL_API_URL, files=files, headers=headers)
-                resp.raise_for_status()
-                payload = resp.json()
+            files = {"file": (os.path.basename(file_path), _upload_bytes(file_path, content), "application/octet-stream")}
+            headers = {"Authorization": f"Bearer {TEXTMILL_API_KEY}"}
+            resp = await client.post(TEXTMILL_API_URL, files=files, headers=headers)
+            resp.raise_for_status()
+            payload = resp.json()
         for k in ("text", "content"):
             v = payload.get(k)
             if isinstance(v, str) and v.strip():
@@ -429,20 +465,19 @@ async def _ocr_with_textmill(file_path: str) -> str:
     except Exception as e:
         logging.error(f"TextMill request failed: {e}")
         return ""
-async def _convert_docx_with_zamzar(file_path: str) -> str:
+async def _convert_docx_with_zamzar(file_path: str, content: Optional[bytes] = None) -> str:
     if not (ZAMZAR_API_URL and ZAMZAR_API_KEY):
         return ""
     try:
         async with httpx.AsyncClient(timeout=60.0) as client:
-            with open(file_path, "rb") as f:
-                files = {"source_file": (os.path.basename(file_path), f, "application/vnd.openxmlformats-officedocument.wordprocessingml.document")}
-                data = {"target_format": "txt"}
-                headers = {"Authorization": f"Bearer {ZAMZAR_API_KEY}"}
-                resp = await client.post(ZAMZAR_API_URL, data=data, files=files, headers=headers)
-                resp.raise_for_status()
-                if resp.headers.get("content-type", "").startswith("text/"):
-                    return (resp.text or "").strip()
-                payload = resp.json()
+            files = {"source_file": (os.path.basename(file_path), _upload_bytes(file_path, content), "application/vnd.openxmlformats-officedocument.wordprocessingml.document")}
+            data = {"target_format": "txt"}
+            headers = {"Authorization": f"Bearer {ZAMZAR_API_KEY}"}
+            resp = await client.post(ZAMZAR_API_URL, data=data, files=files, headers=headers)
+            resp.raise_for_status()
+            if resp.headers.get("content-type", "").startswith("text/"):
+                return (resp.text or "").strip()
+            payload = resp.json()
         for k in ("text", "content"):
             v = payload.get(k)
             if isinstance(v, str) and v.strip():
@@ -451,25 +486,48 @@ async def _convert_docx_with_zamzar(file_path: str) -> str:
     except Exception as e:
         logging.error(f"Zamzar request failed: {e}")
         return ""
-async def _try_provider_chain(file_path: str, file_extension: str) -> str:
+def _provider_accepts(provider: str, file_extension: str, file_size: int) -> bool:
+    """Whether `provider` is configured and would actually upload this file."""
+    if provider == "ocrspace":
+        return bool(OCRSPACE_API_KEY) and file_size <= OCRSPACE_MAX_BYTES
+    if provider == "t3xtr":
+        return bool(T3XTR_API_URL and T3XTR_API_KEY)
+    if provider == "apdf":
+        return bool(APDF_API_URL and APDF_API_KEY)
+    if provider == "textmill":
+        return bool(TEXTMILL_API_URL and TEXTMILL_API_KEY)
+    if provider == "zamzar":
+        return file_extension == "docx" and bool(ZAMZAR_API_URL and ZAMZAR_API_KEY)
+    return False
+
+async def _try_provider_chain(file_path: str, file_extension: str, cancel_token: Optional[CancelToken] = None) -> str:
     providers = OCR_CHAIN[:] if OCR_CHAIN else []
     if not providers:
         base = ["ocrspace", "t3xtr", "apdf", "textmill"]
         if file_extension == "docx":
             base.append("zamzar")
         providers = base
+    file_size = os.path.getsize(file_path)
+    content: Optional[bytes] = None
     for p in providers:
+        if cancel_token:
+            cancel_token.check()
+        if not _provider_accepts(p, file_extension, file_size):
+            continue
+        if content is None:
+            # Read the upload once, off the event loop, and only when a provider will send it
+            content = await asyncio.to_thread(_upload_bytes, file_path, None)
         try:
             if p == "ocrspace":
-                t = await _ocr_with_ocrspace(file_path)
+                t = await _ocr_with_ocrspace(file_path, content)
             elif p == "t3xtr":
-                t = await _ocr_with_t3xtr(file_path)
+                t = await _ocr_with_t3xtr(file_path, content)
             elif p == "apdf":
-                t = await _ocr_with_apdf(file_path)
+                t = await _ocr_with_apdf(file_path, content)
             elif p == "textmill":
-                t = await _ocr_with_textmill(file_path)
+                t = await _ocr_with_textmill(file_path, content)
             elif p == "zamzar" and file_extension == "docx":
-                t = await _convert_docx_with_zamzar(file_path)
+                t = await _convert_docx_with_zamzar(file_path, content)
             else:
                 t = ""
             if isinstance(t, str) and t.strip():
@@ -482,14 +540,25 @@ import ollama
 import google.generativeai as genai
 
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+GEMINI_API_ENDPOINT = os.environ.get("GEMINI_API_ENDPOINT")  # Override, e.g. a local stand-in for load tests
+# Prompt budgets (approximate tokens) for the document excerpt sent to each model
+GEMINI_PROMPT_TOKENS = int(os.environ.get("GEMINI_PROMPT_TOKENS", "2000"))
+OLLAMA_PROMPT_TOKENS = int(os.environ.get("OLLAMA_PROMPT_TOKENS", "1000"))
+# LLM calls get their own bounded pool so slow generations cannot starve OCR and cost estimation
+LLM_MAX_WORKERS = int(os.environ.get("LLM_MAX_WORKERS", "8"))
+_llm_executor = ThreadPoolExecutor(max_workers=max(1, LLM_MAX_WORKERS), thread_name_prefix="llm")
 
-def _generate_mcqs_with_gemini(text: str) -> List[QuestionData]:
-    """Generates Multiple Choice Questions using Gemini."""
+def _generate_mcqs_with_gemini(text: str, timeout: Optional[float] = None) -> List[QuestionData]:
+    """Generates Multiple Choice Questions using Gemini; `timeout` bounds the request in seconds."""
     if not GEMINI_API_KEY:
         raise ValueError("GEMINI_API_KEY not set")
     
-    genai.configure(api_key=GEMINI_API_KEY)
+    if GEMINI_API_ENDPOINT:
+        genai.configure(api_key=GEMINI_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+    else:
+        genai.configure(api_key=GEMINI_API_KEY)
     model = genai.GenerativeModel('gemini-1.5-flash')
+    excerpt = compact_text(text, GEMINI_PROMPT_TOKENS)
     
     prompt = f"""
     You are an expert quiz-maker assistant. Your task is to create multiple-choice questions based on the provided text. You must respond ONLY with a valid JSON array. Do not provide any explanation or introductory text.
@@ -509,12 +578,12 @@ def _generate_mcqs_with_gemini(text: str) -> List[QuestionData]:
 
     Here is the text:
     ---
-    {text[:8000]}
+    {excerpt}
     ---
     """
     
     try:
-        response = model.generate_content(prompt)
+        response = model.generate_content(prompt, request_options={"timeout": timeout} if timeout is not None else None)
         generated_content = response.text
         
         # Attempt to clean markdown code blocks if present
@@ -526,12 +595,12 @@ def _generate_mcqs_with_gemini(text: str) -> List[QuestionData]:
         questions_raw = json.loads(generated_content)
         return [QuestionData(**q) for q in questions_raw]
     except Exception as e:
-        logging.error(f"Gemini generation failed: {e}")
-        logging.error(traceback.format_exc())
+        logging.error(f"Gemini generation failed: {e}", exc_info=True)
         raise
 
-def _generate_mcqs_with_ollama(text: str) -> List[QuestionData]:
-    """Generates Multiple Choice Questions using Ollama."""
+def _generate_mcqs_with_ollama(text: str, timeout: Optional[float] = None) -> List[QuestionData]:
+    """Generates Multiple Choice Questions using Ollama; `timeout` bounds the request in seconds."""
+    excerpt = compact_text(text, OLLAMA_PROMPT_TOKENS)
     
     # The prompt should enforce the JSON structure.
     ollama_prompt = f"""
@@ -553,12 +622,13 @@ The output format MUST be a JSON array of objects, where each object has the fol
 
 Here is the text:
 ---
-{text[:4000]}
+{excerpt}
 ---
 """
     
     try:
-        response = ollama.chat(model='llama3', messages=[{'role': 'user', 'content': ollama_prompt}])
+        # Host comes from OLLAMA_HOST, as with the module-level client
+        response = ollama.Client(timeout=timeout).chat(model='llama3', messages=[{'role': 'user', 'content': ollama_prompt}])
         generated_content = response['message']['content']
 
         # Attempt to clean markdown code blocks if present
@@ -570,8 +640,7 @@ Here is the text:
         questions_raw = json.loads(generated_content)
         return [QuestionData(**q) for q in questions_raw]
     except Exception as e:
-        logging.error(f"Ollama generation failed: {e}")
-        logging.error(traceback.format_exc())
+        logging.error(f"Ollama generation failed: {e}", exc_info=True)
         # print(f"Raw content: {generated_content}") # Debug if needed
         raise
 
@@ -621,18 +690,110 @@ def _generate_mcqs(text: str) -> List[QuestionData]:
 
 import tempfile
 
-async def process_document_logic(document_id: uuid.UUID, file_path: str):
+def _extract_text(file_path: str, file_extension: str, stats: Dict, cancel_token: Optional[CancelToken] = None) -> str:
+    """Text-layer extraction for a downloaded file. Blocking; runs in a worker thread."""
+    if file_extension == 'pdf':
+        return _extract_text_from_pdf(file_path, stats, cancel_token)
+    if file_extension in ['png', 'jpg', 'jpeg']:
+        return _extract_text_from_image(file_path)
+    if file_extension == 'docx':
+        return _extract_text_from_docx(file_path, cancel_token)
+    if file_extension == 'txt':
+        # For text files, decode only the head of the file from a memory map
+        try:
+            return read_text_file(file_path, cancel_token=cancel_token)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            logging.error(f"Failed to read text file: {e}")
+            return ""
+    raise ValueError(f"Unsupported file type: {file_extension}")
+
+def estimate_document_cost(file_path: str) -> Dict:
+    """
+    Estimates a job's cost at arrival from file type, size, page count and text layer.
+    Returns the features, whether OCR is expected, the predicted seconds for the
+    whole job and for the work before the LLM call (download, extraction, OCR).
+    """
+    file_extension = file_path.split('.')[-1].lower()
+    llm_stage = "llm_gemini" if GEMINI_API_KEY else "llm_ollama"
+    features: Dict = {"file_type": file_extension, "size_mb": 0.0, "page_count": None, "text_ratio": None, "llm": llm_stage}
+    source = _resolve_storage_path(file_path)
+    if source:
+        try:
+            features["size_mb"] = round(os.path.getsize(source) / 1024 / 1024, 3)
+        except OSError:
+            pass
+        if file_extension == 'pdf':
+            features.update(_probe_pdf(source))
+    stages = ["download", "extract"]
+    needs_ocr = file_extension in ['png', 'jpg', 'jpeg']
+    if needs_ocr and not _tesseract_available():
+        stages.append("ocr_providers")
+    if file_extension == 'pdf' and features["text_ratio"] is not None and features["text_ratio"] < 0.5:
+        needs_ocr = True
+        if OCR_CHAIN or OCRSPACE_API_KEY or T3XTR_API_KEY or APDF_API_KEY or TEXTMILL_API_KEY:
+            stages.append("ocr_providers")
+        else:
+            stages += ["ocr_local_images", "ocr_raster"]
+    return {
+        "features": features,
+        "needs_ocr": needs_ocr,
+        "estimated_seconds": estimator.remaining(features, stages + [llm_stage, "callback"]),
+        "pre_llm_seconds": estimator.remaining(features, stages),
+    }
+
+@contextmanager
+def _timed(timings: Dict[str, float], stage: str, incomplete: Optional[set] = None):
+    # A stage whose block raises is marked incomplete so its time never trains the ETA model
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        if incomplete is not None:
+            incomplete.add(stage)
+        raise
+    finally:
+        timings[stage] = round(timings.get(stage, 0.0) + time.perf_counter() - start, 4)
+
+async def process_document_logic(document_id: uuid.UUID, file_path: str, profile: bool = False):
     logging.info(f"Starting document processing for document_id: {document_id}, file_path: {file_path}")
     # Use cross-platform temporary directory
     temp_dir = tempfile.gettempdir()
-    local_file_path = os.path.join(temp_dir, f"{document_id}_{os.path.basename(file_path)}")
+    # Unique per run: a cancelled run may still be cleaning up while its replacement downloads
+    local_file_path = os.path.join(temp_dir, f"{document_id}_{uuid.uuid4().hex[:8]}_{os.path.basename(file_path)}")
     extracted_text = ""
     callback_success = False
+    file_extension = file_path.split('.')[-1].lower()
+    stage_timings: Dict[str, float] = {}
+    incomplete_stages = set()  # Failed stages; kept out of the ETA history
+    started_at = time.monotonic()
+    llm_stage = "llm_gemini" if GEMINI_API_KEY else "llm_ollama"
+    features: Dict = {"file_type": file_extension, "size_mb": 0.0, "page_count": None, "text_ratio": None, "llm": llm_stage}
+    deadline = Deadline(0)
+    cancel_token = cancellation.register(document_id)
+    cancelled = False
+    profiler = JobProfiler.start(document_id) if should_profile(profile) else None
+
+    def eta(*stages: str) -> int:
+        return estimator.remaining(features, stages)
+
+    def record_cutoff(stage: str):
+        # A stage cut off by the deadline ran at least this long. Keep it as a lower bound so a
+        # slow provider's estimate, and with it the next job's budget, grows instead of staying put
+        incomplete_stages.discard(stage)
+        if stage in stage_timings:
+            stage_timings[stage] = round(max(stage_timings[stage], estimator.predict(stage, features)), 4)
+
+    def in_thread(fn):
+        # cProfile only sees the thread that enabled it; worker-thread stages report into the job's profile
+        return profiler.wrap(fn) if profiler else fn
 
     async def post_progress(percent: int, message: str, eta_seconds: int, status: str = "processing"):
         tries = 0
         last_err = None
-        if DISABLE_LARAVEL_CALLBACKS:
+        # A cancelled run must not overwrite the status of whatever replaced it
+        if DISABLE_LARAVEL_CALLBACKS or cancel_token.cancelled:
             return
         while tries < 3:
             tries += 1
@@ -657,85 +818,113 @@ async def process_document_logic(document_id: uuid.UUID, file_path: str):
             logging.error(f"Failed to post progress after retries: {last_err}")
 
     try:
-        await post_progress(10, "Queued", 40, "processing")
-        _download_file_from_supabase(file_path, local_file_path)
+        await post_progress(10, "Queued", eta("download", "extract", llm_stage, "callback"), "processing")
+        source_path = local_file_path
+        with _timed(stage_timings, "download", incomplete_stages):
+            if file_extension == 'txt':
+                # Only the head of a text file is decoded, so map it in place instead of copying all of it
+                source_path = await asyncio.to_thread(in_thread(_resolve_storage_path), file_path)
+                if not source_path:
+                    raise FileNotFoundError(f"Source file not found for '{file_path}' in storage app/private/public")
+            else:
+                await asyncio.to_thread(in_thread(_download_file_from_supabase), file_path, local_file_path)
+        cancel_token.check()
         try:
-            size = os.path.getsize(local_file_path)
-            await post_progress(25, f"Downloading file bytes={size}", 30, "processing")
+            size = os.path.getsize(source_path)
+            features["size_mb"] = round(size / 1024 / 1024, 3)
+            await post_progress(25, f"Downloading file bytes={size}", eta("extract", llm_stage, "callback"), "processing")
         except Exception:
-            await post_progress(25, "Downloading file", 30, "processing")
+            await post_progress(25, "Downloading file", eta("extract", llm_stage, "callback"), "processing")
 
-        file_extension = file_path.split('.')[-1].lower()
-        if file_extension == 'pdf':
-            extracted_text = _extract_text_from_pdf(local_file_path)
-        elif file_extension in ['png', 'jpg', 'jpeg']:
-            extracted_text = _extract_text_from_image(local_file_path)
-        elif file_extension == 'docx':
-            extracted_text = _extract_text_from_docx(local_file_path)
-        elif file_extension == 'txt':
-            # For text files, just read the content directly
-            try:
-                with open(local_file_path, 'r', encoding='utf-8') as f:
-                    extracted_text = f.read()
-            except UnicodeDecodeError:
-                # Try with different encoding if UTF-8 fails
-                try:
-                    with open(local_file_path, 'r', encoding='latin-1') as f:
-                        extracted_text = f.read()
-                except Exception as e:
-                    logging.error(f"Failed to read text file: {e}")
-                    extracted_text = ""
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
-        await post_progress(55, "Extracting text", 20, "processing")
+        with _timed(stage_timings, "extract", incomplete_stages):
+            # Parsing is CPU-bound; keep it off the event loop so other lanes keep running
+            extracted_text = await asyncio.to_thread(in_thread(_extract_text), source_path, file_extension, features, cancel_token)
+        cancel_token.check()
+
+        # Budget the job from its start, now that page count and text-layer ratio are known
+        external_ocr_configured = bool(OCR_CHAIN or OCRSPACE_API_KEY or T3XTR_API_KEY or APDF_API_KEY or TEXTMILL_API_KEY)
+        ocr_plan: List[str] = []
+        if not extracted_text.strip():
+            if file_extension == 'pdf':
+                ocr_plan = (["ocr_providers"] if external_ocr_configured else []) + (["ocr_local_images", "ocr_raster"] if _tesseract_available() else [])
+            elif file_extension in ['png', 'jpg', 'jpeg'] and not _tesseract_available():
+                ocr_plan = ["ocr_providers"]
+        deadline = Deadline.for_job(eta("download", "extract", *ocr_plan, llm_stage, "callback"), started_at)
+        await post_progress(55, "Extracting text", eta(*ocr_plan, llm_stage, "callback"), "processing")
         try:
-            await post_progress(58, f"Extracted text len={len(extracted_text)}", 18, "processing")
+            await post_progress(58, f"Extracted text len={len(extracted_text)}", eta(*ocr_plan, llm_stage, "callback"), "processing")
         except Exception:
             pass
 
         if not extracted_text.strip():
             if file_extension == 'pdf':
-                await post_progress(60, "No text found, attempting OCR", 20, "processing")
+                await post_progress(60, "No text found, attempting OCR", eta(*ocr_plan, llm_stage, "callback"), "processing")
                 
                 # Priority 1: External OCR Providers (like ocr.space)
                 # Check if any provider is configured via API key or explicit chain
-                if OCR_CHAIN or OCRSPACE_API_KEY or T3XTR_API_KEY or APDF_API_KEY or TEXTMILL_API_KEY:
-                    await post_progress(65, "Attempting OCR with external provider", 18, "processing")
+                if external_ocr_configured:
+                    await post_progress(65, "Attempting OCR with external provider", eta(*ocr_plan, llm_stage, "callback"), "processing")
                     try:
-                        extracted_text = await _try_provider_chain(local_file_path, file_extension)
-                        await post_progress(70, f"External OCR text len={len(extracted_text)}", 15, "processing")
+                        with _timed(stage_timings, "ocr_providers", incomplete_stages):
+                            extracted_text = await asyncio.wait_for(_try_provider_chain(local_file_path, file_extension, cancel_token), timeout=deadline.remaining())
+                        await post_progress(70, f"External OCR text len={len(extracted_text)}", eta("ocr_local_images", "ocr_raster", llm_stage, "callback"), "processing")
+                    except asyncio.TimeoutError:
+                        logging.warning(f"Deadline reached in external OCR for document {document_id}")
+                        record_cutoff("ocr_providers")
+                        extracted_text = ""
+                    except JobCancelled:
+                        raise
                     except Exception as ext_ocr_err:
                         logging.error(f"External OCR provider failed: {ext_ocr_err}")
+                        incomplete_stages.add("ocr_providers")
                         extracted_text = "" # Ensure it's empty to allow fallback
 
                 # Priority 2: Local Tesseract OCR (as a fallback)
-                if not extracted_text.strip() and _tesseract_available():
-                    await post_progress(72, "External OCR failed or not configured. Falling back to local OCR.", 15, "processing")
+                if not extracted_text.strip() and _tesseract_available() and not deadline.expired():
+                    await post_progress(72, "External OCR failed or not configured. Falling back to local OCR.", eta("ocr_local_images", "ocr_raster", llm_stage, "callback"), "processing")
                     try:
                         # First, try extracting images from the PDF and OCRing them
-                        extracted_text = _extract_text_from_pdf_images(local_file_path)
-                        await post_progress(75, f"Local OCR (images) text len={len(extracted_text)}", 12, "processing")
+                        with _timed(stage_timings, "ocr_local_images", incomplete_stages):
+                            extracted_text = await asyncio.to_thread(in_thread(_extract_text_from_pdf_images), local_file_path, deadline, cancel_token)
+                        await post_progress(75, f"Local OCR (images) text len={len(extracted_text)}", eta("ocr_raster", llm_stage, "callback"), "processing")
                         
                         # If that fails, rasterize the whole page
-                        if not extracted_text.strip():
-                            await post_progress(78, "Rasterizing pages for deeper local OCR", 10, "processing")
-                            extracted_text = _ocr_rasterize_pdf_pages(local_file_path)
-                            await post_progress(80, f"Local OCR (raster) text len={len(extracted_text)}", 8, "processing")
+                        if not extracted_text.strip() and not deadline.expired() and not cancel_token.cancelled:
+                            await post_progress(78, "Rasterizing pages for deeper local OCR", eta("ocr_raster", llm_stage, "callback"), "processing")
+                            with _timed(stage_timings, "ocr_raster", incomplete_stages):
+                                extracted_text = await asyncio.to_thread(in_thread(_ocr_rasterize_pdf_pages), local_file_path, deadline, cancel_token)
+                            await post_progress(80, f"Local OCR (raster) text len={len(extracted_text)}", eta(llm_stage, "callback"), "processing")
 
                     except Exception as ocr_e:
                         logging.error(f"Local OCR fallback failed: {ocr_e}")
+                        incomplete_stages.update(("ocr_local_images", "ocr_raster"))
+                    if deadline.expired():
+                        # Page loops stop early at the deadline; whichever ran last was cut off
+                        record_cutoff("ocr_raster" if "ocr_raster" in stage_timings else "ocr_local_images")
+                cancel_token.check()
+
+                # Out of time: the document metadata is the only text left that costs nothing to get
+                if not extracted_text.strip() and deadline.expired():
+                    extracted_text = await asyncio.to_thread(in_thread(_extract_text_from_pdf_metadata), local_file_path)
 
                 # If all OCR attempts fail
-                elif not extracted_text.strip():
-                     await post_progress(62, "No text found. All OCR methods (external and local) failed or were not configured.", 20, "failed")
+                if not extracted_text.strip():
+                     await post_progress(62, "No text found. All OCR methods (external and local) failed or were not configured.", 0, "failed")
 
             # Handling for non-PDF images (which only have OCR)
             if not extracted_text.strip() and file_extension in ['png', 'jpg', 'jpeg']:
                 if _tesseract_available():
-                    extracted_text = _extract_text_from_image(local_file_path)
+                    with _timed(stage_timings, "ocr_local_image", incomplete_stages):
+                        extracted_text = await asyncio.to_thread(in_thread(_extract_text_from_image), local_file_path)
                 else:
-                    await post_progress(65, "Tesseract not found. Attempting OCR with external provider.", 18, "processing")
-                    extracted_text = await _try_provider_chain(local_file_path, file_extension)
+                    await post_progress(65, "Tesseract not found. Attempting OCR with external provider.", eta("ocr_providers", llm_stage, "callback"), "processing")
+                    try:
+                        with _timed(stage_timings, "ocr_providers", incomplete_stages):
+                            extracted_text = await asyncio.wait_for(_try_provider_chain(local_file_path, file_extension, cancel_token), timeout=deadline.remaining())
+                    except asyncio.TimeoutError:
+                        logging.warning(f"Deadline reached in external OCR for document {document_id}")
+                        record_cutoff("ocr_providers")
+                cancel_token.check()
 
             # Final check
             if not extracted_text.strip():
@@ -746,51 +935,92 @@ async def process_document_logic(document_id: uuid.UUID, file_path: str):
             raise ValueError("No usable text to generate questions")
         
         questions = []
+
+        async def generate_with(stage: str, generate):
+            # LLM calls are blocking; run them in the LLM pool with the time left as the client timeout
+            cancel_token.check()
+            remaining = None
+            # Until the model has real timings for this stage the cold-start default may be far too
+            # short for the host, so the call runs unbounded rather than being cut off every time
+            if estimator.trained(stage, features):
+                remaining = deadline.remaining()
+            if remaining is not None:
+                remaining -= DEADLINE_RESERVE_SECONDS
+                if remaining <= 0:
+                    logging.warning(f"Skipping {stage} for document {document_id}: deadline reached")
+                    return []
+            loop = asyncio.get_running_loop()
+            # The client timeout trails the wait by a second so a cut-off shows up as TimeoutError here
+            client_timeout = remaining + 1.0 if remaining is not None else None
+            with _timed(stage_timings, stage, incomplete_stages):
+                call = loop.run_in_executor(_llm_executor, in_thread(generate), extracted_text, client_timeout)
+                return await asyncio.wait_for(call, timeout=remaining)
         
         # Priority 1: Gemini (fastest cloud option)
         if not questions and GEMINI_API_KEY:
             try:
-                await post_progress(85, "Generating questions with Gemini...", 10, "processing")
-                questions = _generate_mcqs_with_gemini(extracted_text)
+                await post_progress(85, "Generating questions with Gemini...", eta("llm_gemini", "callback"), "processing")
+                questions = await generate_with("llm_gemini", _generate_mcqs_with_gemini)
+            except asyncio.TimeoutError:
+                logging.warning(f"Gemini generation for document {document_id} cut off by deadline")
+                record_cutoff("llm_gemini")
+            except JobCancelled:
+                raise
             except Exception:
-                pass
+                incomplete_stages.add("llm_gemini")
         
         # Priority 2: Ollama (local)
         if not questions:
              try:
-                 await post_progress(86, "Generating questions with Ollama...", 10, "processing")
-                 questions = _generate_mcqs_with_ollama(extracted_text)
+                 await post_progress(86, "Generating questions with Ollama...", eta("llm_ollama", "callback"), "processing")
+                 questions = await generate_with("llm_ollama", _generate_mcqs_with_ollama)
+             except asyncio.TimeoutError:
+                 logging.warning(f"Ollama generation for document {document_id} cut off by deadline")
+                 record_cutoff("llm_ollama")
+             except JobCancelled:
+                 raise
              except Exception:
-                 pass
+                 incomplete_stages.add("llm_ollama")
         
         # Priority 3: Fallback
         if not questions:
-            await post_progress(88, "AI generation unavailable, using basic method", 10, "processing")
-            questions = _generate_mcqs(extracted_text)
+            await post_progress(88, "AI generation unavailable, using basic method", eta("llm_fallback", "callback"), "processing")
+            with _timed(stage_timings, "llm_fallback", incomplete_stages):
+                questions = _generate_mcqs(extracted_text)
             
-        await post_progress(95, "Questions generated", 5, "processing")
+        cancel_token.check()
+        await post_progress(95, "Questions generated", eta("callback"), "processing")
 
         # Call back to Laravel
         tries = 0
         if DISABLE_LARAVEL_CALLBACKS:
             callback_success = True
-        while tries < 3 and not callback_success:
-            tries += 1
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        LARAVEL_CALLBACK_URL.format(document_id=document_id),
-                        json=AICallbackPayload(questions=questions).model_dump(),
-                        headers={"X-Internal-Secret": AI_SERVICE_SECRET},
-                        timeout=30.0
-                    )
-                    response.raise_for_status()
-                    callback_success = True
-                    logging.info(f"Successfully sent questions for document {document_id} to Laravel.")
-            except Exception as e:
-                await asyncio.sleep(0.75 * tries)
+        with _timed(stage_timings, "callback", incomplete_stages):
+            while tries < 3 and not callback_success:
+                tries += 1
+                try:
+                    async with httpx.AsyncClient() as client:
+                        response = await client.post(
+                            LARAVEL_CALLBACK_URL.format(document_id=document_id),
+                            json=AICallbackPayload(questions=questions).model_dump(),
+                            headers={"X-Internal-Secret": AI_SERVICE_SECRET},
+                            timeout=30.0
+                        )
+                        response.raise_for_status()
+                        callback_success = True
+                        logging.info(f"Successfully sent questions for document {document_id} to Laravel.")
+                except Exception as e:
+                    await asyncio.sleep(0.75 * tries)
+        if not callback_success:
+            incomplete_stages.add("callback")
         await post_progress(100, "Completed", 0, "completed")
 
+    except (JobCancelled, asyncio.CancelledError) as e:
+        # Cancelled runs stay silent towards Laravel; the document was deleted or re-submitted
+        cancelled = True
+        logging.info(f"Processing of document {document_id} cancelled")
+        if isinstance(e, asyncio.CancelledError):
+            raise
     except Exception as e:
         err_msg = str(e)
         if "Stream has ended unexpectedly" in err_msg:
@@ -799,8 +1029,7 @@ async def process_document_logic(document_id: uuid.UUID, file_path: str):
             diag = f" stage=final text_len={len(extracted_text)} path={file_path}"
         except Exception:
             diag = ""
-        logging.error(f"Error processing document {document_id}: {err_msg}{diag}")
-        logging.error(traceback.format_exc())
+        logging.error(f"Error processing document {document_id}: {err_msg}{diag}", exc_info=True)
         # In a real app, you'd send a 'failed' status back to Laravel
         # For this MVP, we'll just log and let the Laravel job eventually timeout/fail if callback didn't happen
         if not callback_success and not DISABLE_LARAVEL_CALLBACKS:
@@ -822,5 +1051,31 @@ async def process_document_logic(document_id: uuid.UUID, file_path: str):
     finally:
         # Clean up local file after processing
         if os.path.exists(local_file_path):
-            os.remove(local_file_path)
-            logging.info(f"Cleaned up local file: {local_file_path}")
+            try:
+                os.remove(local_file_path)
+                logging.info(f"Cleaned up local file: {local_file_path}")
+            except OSError as rm_e:
+                logging.warning(f"Could not remove local file {local_file_path}: {rm_e}")
+        cancellation.release(cancel_token)
+        # Stop the profiler before awaiting anything: a cancellation arriving at an await
+        # below would otherwise leave it enabled and the profiling slot held until restart
+        if profiler:
+            profiler.stop()
+        # Both writes go to worker threads up front and are shielded, so they complete even
+        # if this task is cancelled while waiting on them
+        loop = asyncio.get_running_loop()
+        writes = []
+        if profiler:
+            writes.append(loop.run_in_executor(None, profiler.write, {
+                "file_path": file_path,
+                "file_type": file_extension,
+                "page_count": features.get("page_count"),
+                "text_len": len(extracted_text),
+                "stage_timings": dict(stage_timings),
+            }))
+        if not cancelled:
+            completed = {k: v for k, v in stage_timings.items() if k not in incomplete_stages}
+            writes.append(loop.run_in_executor(None, estimator.record, features, completed))
+        for result in await asyncio.shield(asyncio.gather(*writes, return_exceptions=True)):
+            if isinstance(result, Exception):
+                logging.error(f"Failed to write job records for {document_id}: {result}")
@@ -0,0 +1,200 @@
+import codecs
+import mmap
+import os
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+from typing import Iterator, List, Optional, Tuple
+
+from .cancellation import CancelToken
+from .compaction import CHARS_PER_TOKEN, compact_text
+
+# --- Streaming readers for DOCX and plain-text uploads ---
+# Standard library only, so they can be used (and tested) without the OCR and
+# LLM dependencies the rest of the pipeline needs.
+TXT_MAX_CHARS = int(os.environ.get("TXT_MAX_CHARS", "200000"))  # Characters handed to later stages
+if TXT_MAX_CHARS <= 0:
+    # 0 used to mean "decode everything into memory"; whole-file reads are TXT_STREAM_COMPACT now
+    TXT_MAX_CHARS = 200000
+# Read the whole file instead of its head, keeping the most informative TXT_MAX_CHARS characters
+TXT_STREAM_COMPACT = str(os.environ.get("TXT_STREAM_COMPACT", "")).lower() in {"1", "true", "yes"}
+TXT_CHUNK_BYTES = int(os.environ.get("TXT_CHUNK_BYTES", str(1024 * 1024)))
+_DOCX_CANCEL_CHECK_EVERY = 2000  # Parse events between cancellation checkpoints
+
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+
+def iter_docx_part_text(stream, cancel_token: Optional[CancelToken] = None) -> Iterator[str]:
+    """
+    Yields one line per paragraph (and one per table row, cells joined with " | ")
+    from a WordprocessingML part, parsing incrementally and discarding elements as
+    soon as they are consumed. Text boxes are included; the VML fallback copies of
+    them are skipped so they are not emitted twice. Raises JobCancelled once
+    `cancel_token` is cancelled.
+    """
+    paragraphs: List[List[str]] = []  # open paragraphs (text boxes nest inside paragraphs)
+    rows: List[List[str]] = []        # open table rows
+    cells: List[List[str]] = []       # open table cells
+    fallback_depth = 0
+    body = None
+    for n, (event, elem) in enumerate(ET.iterparse(stream, events=("start", "end"))):
+        if cancel_token and n % _DOCX_CANCEL_CHECK_EVERY == 0:
+            cancel_token.check()
+        tag = elem.tag
+        if event == "start":
+            if tag == _MC_FALLBACK:
+                fallback_depth += 1
+            elif fallback_depth:
+                continue
+            elif tag == _W_NS + "p":
+                paragraphs.append([])
+            elif tag == _W_NS + "tr":
+                rows.append([])
+            elif tag == _W_NS + "tc":
+                cells.append([])
+            elif body is None and tag in (_W_NS + "body", _W_NS + "hdr", _W_NS + "ftr", _W_NS + "footnotes", _W_NS + "endnotes"):
+                body = elem
+            continue
+        if tag == _MC_FALLBACK:
+            fallback_depth -= 1
+        elif fallback_depth:
+            pass
+        elif tag == _W_NS + "t" and paragraphs:
+            paragraphs[-1].append(elem.text or "")
+        elif tag == _W_NS + "tab" and paragraphs:
+            paragraphs[-1].append("\t")
+        elif tag in (_W_NS + "br", _W_NS + "cr") and paragraphs:
+            paragraphs[-1].append("\n")
+        elif tag == _W_NS + "p" and paragraphs:
+            text = "".join(paragraphs.pop()).strip()
+            if text:
+                if cells:
+                    cells[-1].append(text)
+                else:
+                    yield text
+        elif tag == _W_NS + "tc" and cells:
+            cell = " ".join(cells.pop())
+            if rows:
+                rows[-1].append(cell)
+        elif tag == _W_NS + "tr" and rows:
+            line = " | ".join(c for c in rows.pop() if c)
+            if line:
+                if cells:
+                    cells[-1].append(line)
+                else:
+                    yield line
+        elem.clear()
+        # Drop finished top-level blocks so memory does not grow with document length
+        if body is not None and not (paragraphs or rows or cells) and tag in (_W_NS + "p", _W_NS + "tbl", _W_NS + "sdt"):
+            body.clear()
+
+
+def iter_docx_text(file_path: str, cancel_token: Optional[CancelToken] = None) -> Iterator[str]:
+    """Streams text from the body, then footnotes/endnotes, then headers and footers."""
+    with zipfile.ZipFile(file_path) as zf:
+        names = zf.namelist()
+        parts = ["word/document.xml"]
+        parts += [n for n in ("word/footnotes.xml", "word/endnotes.xml") if n in names]
+        parts += sorted(n for n in names if re.match(r"word/(header|footer)\d*\.xml$", n))
+        for part in parts:
+            with zf.open(part) as stream:
+                yield from iter_docx_part_text(stream, cancel_token)
+
+
+_TEXT_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+
+
+def detect_text_encoding(sample: bytes, complete: bool = False) -> Tuple[str, int]:
+    """
+    Returns the encoding of a text sample and the length of its BOM, if any.
+    `complete` marks a sample that is the whole file, so a truncated trailing
+    multi-byte sequence counts against UTF-8.
+    """
+    for bom, encoding in _TEXT_BOMS:
+        if sample.startswith(bom):
+            return encoding, len(bom)
+    try:
+        # Incremental so a multi-byte character cut off at the end of the sample is not an error
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=complete)
+        return "utf-8", 0
+    except UnicodeDecodeError:
+        return "latin-1", 0
+
+
+def iter_text_file(file_path: str, chunk_bytes: int = TXT_CHUNK_BYTES, cancel_token: Optional[CancelToken] = None) -> Iterator[str]:
+    """
+    Streams a text file as decoded chunks from a memory map. The encoding is
+    detected once from the first 64 KB; stray invalid bytes later on are replaced
+    rather than forcing a second pass. Raises JobCancelled between chunks once
+    `cancel_token` is cancelled.
+    """
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            encoding, start = detect_text_encoding(mm[:65536], complete=len(mm) <= 65536)
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            for offset in range(start, len(mm), chunk_bytes):
+                if cancel_token:
+                    cancel_token.check()
+                chunk = decoder.decode(mm[offset:offset + chunk_bytes])
+                if chunk:
+                    yield chunk
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+
+
+def _compact_text_file(file_path: str, max_chars: int, cancel_token: Optional[CancelToken] = None) -> str:
+    """
+    Streams the whole file through the extractive compactor, chunk by chunk, so
+    memory stays at about `max_chars` plus one chunk however large the file is.
+    """
+    max_tokens = max(1, max_chars // CHARS_PER_TOKEN)
+    kept = ""
+    carry = ""
+    for chunk in iter_text_file(file_path, TXT_CHUNK_BYTES, cancel_token):
+        # Hold back the trailing partial line so no sentence is split across chunks
+        body, _, carry = (carry + chunk).rpartition("\n")
+        if not body:
+            if len(carry) < 2 * TXT_CHUNK_BYTES:
+                continue
+            body, carry = carry, ""
+        kept = compact_text(f"{kept}\n{body}" if kept else body, max_tokens)
+    if carry:
+        kept = compact_text(f"{kept}\n{carry}" if kept else carry, max_tokens)
+    return kept
+
+
+def read_text_file(
+    file_path: str,
+    max_chars: int = TXT_MAX_CHARS,
+    cancel_token: Optional[CancelToken] = None,
+    whole_file: bool = TXT_STREAM_COMPACT,
+) -> str:
+    """
+    Decodes only as much of a text file as downstream stages use: the first
+    `max_chars` characters, or with `whole_file` the most informative `max_chars`
+    characters of the entire file.
+    """
+    if max_chars <= 0:
+        raise ValueError("max_chars must be positive")
+    if whole_file:
+        return _compact_text_file(file_path, max_chars, cancel_token)
+    # At most 4 bytes per character, so small limits never map in more than they need
+    chunk_bytes = min(TXT_CHUNK_BYTES, max(4096, max_chars * 4))
+    parts: List[str] = []
+    total = 0
+    for chunk in iter_text_file(file_path, chunk_bytes, cancel_token):
+        parts.append(chunk)
+        total += len(chunk)
+        if total >= max_chars:
+            break
+    return "".join(parts)[:max_chars]
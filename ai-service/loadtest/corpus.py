@@ -0,0 +1,95 @@
+import os
+import random
+from typing import Dict, List
+
+# --- Synthetic document corpus for load tests ---
+
+_WORDS = (
+    "cell membrane protein energy enzyme reaction molecule nucleus organism tissue "
+    "photosynthesis respiration chlorophyll glucose oxygen carbon nitrogen mitochondria "
+    "ecosystem population evolution mutation genome chromosome inheritance bacteria"
+).split()
+
+
+def _paragraphs(count: int) -> List[str]:
+    paras = []
+    for _ in range(count):
+        sentences = []
+        for _ in range(random.randint(3, 6)):
+            words = random.choices(_WORDS, k=random.randint(8, 16))
+            sentences.append(" ".join(words).capitalize() + ".")
+        paras.append(" ".join(sentences))
+    return paras
+
+
+def _write_txt(path: str, paragraphs: int):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(_paragraphs(paragraphs)))
+
+
+def _write_docx(path: str, paragraphs: int):
+    from docx import Document
+    doc = Document()
+    for p in _paragraphs(paragraphs):
+        doc.add_paragraph(p)
+    table = doc.add_table(rows=3, cols=2)
+    for row in table.rows:
+        for cell in row.cells:
+            cell.text = " ".join(random.choices(_WORDS, k=3))
+    doc.save(path)
+
+
+def _write_pdf(path: str, pages: int, scanned: bool):
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        text = "\n\n".join(_paragraphs(3))
+        if scanned:
+            # Image-only page: forces the OCR path in the service.
+            src = fitz.open()
+            src_page = src.new_page()
+            src_page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=10)
+            pix = src_page.get_pixmap(dpi=100)
+            page.insert_image(page.rect, stream=pix.tobytes("png"))
+            src.close()
+        else:
+            page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def _write_png(path: str):
+    from PIL import Image, ImageDraw
+    im = Image.new("L", (1200, 800), 255)
+    draw = ImageDraw.Draw(im)
+    y = 20
+    for p in _paragraphs(4):
+        for start in range(0, len(p), 90):
+            draw.text((20, y), p[start:start + 90], fill=0)
+            y += 18
+    im.save(path)
+
+
+def build_corpus(target_dir: str, storage_prefix: str, per_type: int) -> Dict[str, List[str]]:
+    """Writes `per_type` documents of each kind; returns storage-relative paths keyed by kind."""
+    os.makedirs(target_dir, exist_ok=True)
+    corpus: Dict[str, List[str]] = {"txt": [], "docx": [], "pdf": [], "scanned": [], "png": []}
+    for i in range(per_type):
+        # Sizes grow across the corpus so the mix covers small and large uploads.
+        scale = 1 + i * 4
+        builders = {
+            "txt": (f"doc{i}.txt", lambda p: _write_txt(p, 5 * scale)),
+            "docx": (f"doc{i}.docx", lambda p: _write_docx(p, 5 * scale)),
+            "pdf": (f"doc{i}.pdf", lambda p: _write_pdf(p, scale, scanned=False)),
+            "scanned": (f"scan{i}.pdf", lambda p: _write_pdf(p, scale, scanned=True)),
+            "png": (f"img{i}.png", _write_png),
+        }
+        for kind, (name, build) in builders.items():
+            try:
+                build(os.path.join(target_dir, name))
+            except Exception as e:
+                print(f"Skipping {kind} corpus document {name}: {e}")
+                continue
+            corpus[kind].append(f"{storage_prefix}/{name}".replace(os.sep, "/"))
+    return corpus
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# --- Local stand-ins for Laravel and the external AI/OCR providers ---
+
+
+@dataclass
+class FaultProfile:
+    """Latency and failure injection for one fake upstream."""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    failure_rate: float = 0.0
+
+    async def apply(self) -> bool:
+        """Sleeps for the configured latency; returns False when this call should fail."""
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000.0
+        if delay:
+            await asyncio.sleep(delay)
+        return random.random() >= self.failure_rate
+
+
+@dataclass
+class JobRecord:
+    submitted_at: float
+    finished_at: Optional[float] = None
+    final_status: Optional[str] = None
+    callback_ok: bool = False
+    callback_attempts: int = 0
+    progress_events: int = 0
+
+
+@dataclass
+class Recorder:
+    jobs: Dict[str, JobRecord] = field(default_factory=dict)
+
+    def submitted(self, document_id: str):
+        self.jobs[document_id] = JobRecord(submitted_at=time.perf_counter())
+
+    def pending(self) -> List[str]:
+        return [d for d, j in self.jobs.items() if j.finished_at is None]
+
+
+_SAMPLE_QUESTIONS = [
+    {
+        "question_text": f"Sample question {i + 1}?",
+        "choices": [
+            {"choice_text": "Answer A", "is_correct": i % 4 == 0},
+            {"choice_text": "Answer B", "is_correct": i % 4 == 1},
+            {"choice_text": "Answer C", "is_correct": i % 4 == 2},
+            {"choice_text": "Answer D", "is_correct": i % 4 == 3},
+        ],
+    }
+    for i in range(5)
+]
+_SAMPLE_TEXT = (
+    "Photosynthesis converts light energy into chemical energy. "
+    "Chlorophyll absorbs mostly blue and red wavelengths of light. "
+) * 20
+
+
+def _failure(name: str) -> JSONResponse:
+    return JSONResponse(status_code=503, content={"error": f"{name} failure injected"})
+
+
+def build_laravel_app(recorder: Recorder, faults: FaultProfile) -> FastAPI:
+    """Fake Laravel exposing the progress and question callback routes the service posts to."""
+    app = FastAPI()
+
+    @app.post("/api/documents/{document_id}/progress")
+    async def progress(document_id: str, request: Request):
+        payload = await request.json()
+        if not await faults.apply():
+            return _failure("laravel progress")
+        job = recorder.jobs.get(document_id)
+        if job:
+            job.progress_events += 1
+            status = payload.get("status")
+            if status in ("completed", "failed") and job.finished_at is None:
+                job.finished_at = time.perf_counter()
+                job.final_status = status
+        return {"ok": True}
+
+    @app.post("/api/documents/{document_id}/questions")
+    async def questions(document_id: str, request: Request):
+        payload = await request.json()
+        job = recorder.jobs.get(document_id)
+        if job:
+            job.callback_attempts += 1
+        if not await faults.apply():
+            return _failure("laravel callback")
+        if job and payload.get("questions"):
+            job.callback_ok = True
+        if job and job.finished_at is None:
+            # The question callback (or the failure callback) marks end-to-end completion.
+            job.finished_at = time.perf_counter()
+            job.final_status = "failed" if payload.get("status") == "failed" else "completed"
+        return {"ok": True}
+
+    return app
+
+
+def build_provider_app(llm: FaultProfile, ocr: FaultProfile) -> FastAPI:
+    """Fake Ollama, Gemini (REST) and OCR provider endpoints."""
+    app = FastAPI()
+
+    @app.post("/api/chat")
+    async def ollama_chat(request: Request):
+        body = await request.json()
+        if not await llm.apply():
+            return _failure("ollama")
+        return {
+            "model": body.get("model", "llama3"),
+            "created_at": "1970-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": json.dumps(_SAMPLE_QUESTIONS)},
+            "done": True,
+        }
+
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def gemini_generate(model: str):
+        if not await llm.apply():
+            return _failure("gemini")
+        return {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": json.dumps(_SAMPLE_QUESTIONS)}]},
+                "finishReason": "STOP",
+                "index": 0,
+            }]
+        }
+
+    @app.post("/ocrspace/parse/image")
+    async def ocrspace():
+        if not await ocr.apply():
+            return _failure("ocr.space")
+        return {"IsErroredOnProcessing": False, "ParsedResults": [{"ParsedText": _SAMPLE_TEXT}]}
+
+    @app.post("/ocr/{provider}")
+    async def generic_ocr(provider: str):
+        if not await ocr.apply():
+            return _failure(provider)
+        return {"text": _SAMPLE_TEXT}
+
+    return app
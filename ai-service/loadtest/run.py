@@ -0,0 +1,219 @@
+"""
+End-to-end load test for the AI service.
+
+Starts local fakes for the Laravel progress/callback routes and for the Ollama,
+Gemini and OCR provider APIs, launches the service against them, drives
+`/process-document` with Poisson arrivals over a mixed document corpus and
+reports throughput, end-to-end latency percentiles and callback delivery.
+
+    python -m loadtest.run --rate 2 --duration 60 --mix txt=5,docx=2,pdf=2,png=1
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+
+from .corpus import build_corpus
+from .fakes import FaultProfile, Recorder, build_laravel_app, build_provider_app
+
+AI_SERVICE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+STORAGE_APP_DIR = os.path.abspath(os.path.join(AI_SERVICE_DIR, "..", "backend", "storage", "app"))
+
+
+def _parse_mix(spec: str) -> Dict[str, float]:
+    mix: Dict[str, float] = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        kind, _, weight = part.partition("=")
+        mix[kind.strip().lower()] = float(weight or 1)
+    return mix
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))  # Nearest-rank
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _service_env(args, laravel_base: str, provider_base: str, state_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        # Synthetic timings must not train the ETAs and deadlines of a real deployment
+        "ETA_TIMINGS_PATH": os.path.join(state_dir, "stage_timings.jsonl"),
+        "PROFILE_DIR": os.path.join(state_dir, "profiles"),
+        "AI_SERVICE_SECRET": args.secret,
+        "LARAVEL_CALLBACK_URL": laravel_base + "/api/documents/{document_id}/questions",
+        "LARAVEL_PROGRESS_URL": laravel_base + "/api/documents/{document_id}/progress",
+        "DISABLE_LARAVEL_CALLBACKS": "",
+        "OLLAMA_HOST": provider_base,
+        "GEMINI_API_KEY": "loadtest" if args.llm == "gemini" else "",
+        "GEMINI_API_ENDPOINT": provider_base,
+        "OCRSPACE_API_KEY": "loadtest",
+        "OCRSPACE_API_URL": provider_base + "/ocrspace/parse/image",
+        "T3XTR_API_URL": provider_base + "/ocr/t3xtr",
+        "T3XTR_API_KEY": "loadtest",
+        "APDF_API_URL": provider_base + "/ocr/apdf",
+        "APDF_API_KEY": "loadtest",
+        "TEXTMILL_API_URL": provider_base + "/ocr/textmill",
+        "TEXTMILL_API_KEY": "loadtest",
+    })
+    return env
+
+
+async def _serve(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server
+
+
+async def _wait_ready(url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url, timeout=2.0)).status_code == 200:
+                    return
+            except Exception:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"AI service at {url} did not become ready within {timeout:.0f}s")
+
+
+async def _drive(args, recorder: Recorder, corpus: Dict[str, List[str]]) -> Dict[str, int]:
+    mix = {k: w for k, w in _parse_mix(args.mix).items() if corpus.get(k)}
+    if not mix:
+        raise ValueError(f"No corpus documents match mix '{args.mix}'")
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    counts = {"submitted": 0, "rejected": 0}
+    in_flight = set()
+
+    async def submit(client: httpx.AsyncClient, file_path: str):
+        document_id = str(uuid.uuid4())
+        recorder.submitted(document_id)
+        counts["submitted"] += 1
+        try:
+            resp = await client.post(
+                f"{args.target}/process-document",
+                json={"secret": args.secret, "document_id": document_id, "file_path": file_path},
+                timeout=30.0,
+            )
+            resp.raise_for_status()
+        except Exception:
+            counts["rejected"] += 1
+            recorder.jobs.pop(document_id, None)
+
+    async with httpx.AsyncClient() as client:
+        end = time.perf_counter() + args.duration
+        while time.perf_counter() < end:
+            kind = random.choices(kinds, weights)[0]
+            task = asyncio.create_task(submit(client, random.choice(corpus[kind])))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            await asyncio.sleep(random.expovariate(args.rate))
+        if in_flight:
+            await asyncio.gather(*in_flight)
+    return counts
+
+
+def _report(recorder: Recorder, counts: Dict[str, int], elapsed: float):
+    jobs = list(recorder.jobs.values())
+    done = [j for j in jobs if j.finished_at is not None]
+    completed = [j for j in done if j.final_status == "completed"]
+    latencies = [j.finished_at - j.submitted_at for j in done]
+    delivered = sum(1 for j in jobs if j.callback_ok)
+    attempts = sum(j.callback_attempts for j in jobs)
+
+    def fmt(v: Optional[float]) -> str:
+        return f"{v:.2f}s" if v is not None else "n/a"
+
+    print("--- Load test results ---")
+    print(f"submitted:            {counts['submitted']} (rejected {counts['rejected']})")
+    print(f"finished:             {len(done)} (completed {len(completed)}, failed {len(done) - len(completed)}, unfinished {len(jobs) - len(done)})")
+    print(f"throughput:           {len(completed) / elapsed * 60:.1f} docs/min over {elapsed:.1f}s")
+    print(f"latency p50/p95/p99:  {fmt(_percentile(latencies, 50))} / {fmt(_percentile(latencies, 95))} / {fmt(_percentile(latencies, 99))}")
+    print(f"callback delivery:    {delivered}/{len(jobs)} jobs ({attempts} attempts)")
+
+
+async def main_async(args):
+    recorder = Recorder()
+    laravel_faults = FaultProfile(args.laravel_latency_ms, args.laravel_jitter_ms, args.laravel_failure_rate)
+    llm_faults = FaultProfile(args.llm_latency_ms, args.llm_jitter_ms, args.llm_failure_rate)
+    ocr_faults = FaultProfile(args.ocr_latency_ms, args.ocr_jitter_ms, args.ocr_failure_rate)
+    laravel = await _serve(build_laravel_app(recorder, laravel_faults), args.laravel_port)
+    providers = await _serve(build_provider_app(llm_faults, ocr_faults), args.provider_port)
+
+    run_dir = os.path.join("loadtest", uuid.uuid4().hex[:8])
+    corpus = build_corpus(os.path.join(STORAGE_APP_DIR, run_dir), run_dir, args.docs_per_type)
+
+    service = None
+    state_dir = None
+    if not args.target:
+        args.target = f"http://127.0.0.1:{args.service_port}"
+        state_dir = tempfile.mkdtemp(prefix="loadtest-state-")
+        env = _service_env(args, f"http://127.0.0.1:{args.laravel_port}", f"http://127.0.0.1:{args.provider_port}", state_dir)
+        service = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.service_port), "--log-level", "warning"],
+            cwd=AI_SERVICE_DIR, env=env,
+        )
+    try:
+        await _wait_ready(args.target + "/", 60.0)
+        started = time.perf_counter()
+        counts = await _drive(args, recorder, corpus)
+        drain_end = time.perf_counter() + args.drain_timeout
+        while recorder.pending() and time.perf_counter() < drain_end:
+            await asyncio.sleep(0.25)
+        _report(recorder, counts, time.perf_counter() - started)
+    finally:
+        if service:
+            service.terminate()
+            try:
+                service.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                service.kill()
+        laravel.should_exit = True
+        providers.should_exit = True
+        shutil.rmtree(os.path.join(STORAGE_APP_DIR, run_dir), ignore_errors=True)
+        if state_dir:
+            shutil.rmtree(state_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rate", type=float, default=1.0, help="Mean arrivals per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to keep submitting")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="Seconds to wait for in-flight jobs afterwards")
+    parser.add_argument("--mix", default="txt=4,docx=2,pdf=2,scanned=1,png=1", help="Weighted corpus mix")
+    parser.add_argument("--docs-per-type", type=int, default=5)
+    parser.add_argument("--llm", choices=["gemini", "ollama"], default="ollama")
+    parser.add_argument("--target", help="Use an already running service instead of launching one")
+    parser.add_argument("--secret", default=os.environ.get("AI_SERVICE_SECRET", "supersecretkey123"))
+    parser.add_argument("--service-port", type=int, default=8011)
+    parser.add_argument("--laravel-port", type=int, default=8090)
+    parser.add_argument("--provider-port", type=int, default=8091)
+    for name, latency in (("laravel", 20.0), ("llm", 2000.0), ("ocr", 800.0)):
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=latency)
+        parser.add_argument(f"--{name}-jitter-ms", type=float, default=latency / 4)
+        parser.add_argument(f"--{name}-failure-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+from app.compaction import CHARS_PER_TOKEN, compact_text
+
+
+def test_text_within_budget_is_returned_unchanged():
+    text = "Short note\nwith odd   spacing.\n"
+    assert compact_text(text, 100) == text
+
+
+def test_wrapped_sentence_is_rejoined():
+    text = "The process plants use to convert light energy is called\nphotosynthesis.\n" + "x" * 50
+    assert "called photosynthesis." in compact_text(text, 30)
+
+
+def test_page_numbers_toc_lines_and_running_headers_are_dropped():
+    pages = [
+        f"Biology Handbook\nPage {i}\nCells divide by mitosis in body tissue number {i}.\n"
+        for i in range(1, 6)
+    ]
+    toc = "Contents\nChapter one ........ 3\nChapter two ........ 9\n"
+    text = toc + "".join(pages)
+    out = compact_text(text, 100)
+    assert len(text) > 100 * CHARS_PER_TOKEN
+    assert "Page" not in out
+    assert "........" not in out
+    assert "Biology Handbook" not in out
+    assert "Cells divide by mitosis in body tissue number 3." in out
+
+
+def test_duplicate_sentences_are_kept_once():
+    text = "Mitochondria produce energy for the cell.\n" * 20 + "Ribosomes assemble proteins from amino acids.\n"
+    out = compact_text(text, 100)
+    assert out.count("Mitochondria produce energy for the cell.") == 1
+    assert "Ribosomes assemble proteins from amino acids." in out
+
+
+def test_output_fits_the_budget():
+    text = " ".join(f"Sentence number {i} describes topic {i % 13} in some detail." for i in range(2000))
+    for tokens in (10, 100, 1000):
+        assert len(compact_text(text, tokens)) <= tokens * CHARS_PER_TOKEN
+
+
+def test_unpunctuated_lines_are_not_merged_into_one_unit():
+    text = "".join(f"row {i} sensor reading value {i * 7} recorded at station {i % 97} status nominal\n" for i in range(5000))
+    out = compact_text(text, 200)
+    assert 0 < len(out) <= 200 * CHARS_PER_TOKEN
+    # Several separate units are chosen, not the head of one giant run-on unit
+    assert out.count("\n") >= 1
@@ -0,0 +1,41 @@
+from app import eta
+from app.eta import Deadline, StageEstimator
+
+
+def _estimator(tmp_path, limit=100):
+    return StageEstimator(str(tmp_path / "timings.jsonl"), limit)
+
+
+def test_cold_start_uses_defaults_until_min_samples(tmp_path):
+    est = _estimator(tmp_path)
+    features = {"file_type": "txt", "size_mb": 0.01}
+    assert not est.trained("llm_ollama", features)
+    assert est.predict("llm_ollama", features) == 30.0
+    for _ in range(eta.ETA_MIN_SAMPLES):
+        est.record(features, {"llm_ollama": 120.0})
+    assert est.trained("llm_ollama", features)
+    assert abs(est.predict("llm_ollama", features) - 120.0) < 1.0
+    # Other file types keep their own model
+    assert not est.trained("llm_ollama", {"file_type": "pdf"})
+
+
+def test_history_file_is_compacted_and_reloaded(tmp_path):
+    est = _estimator(tmp_path, limit=3)
+    for i in range(10):
+        est.record({"file_type": "txt"}, {"extract": float(i)})
+    with open(est.path, encoding="utf-8") as f:
+        assert len(f.readlines()) <= 6
+    reloaded = _estimator(tmp_path, limit=3)
+    reloaded.load()
+    assert [r["stages"]["extract"] for r in reloaded._records] == [7.0, 8.0, 9.0]
+
+
+def test_deadline_budget_is_bounded(monkeypatch):
+    monkeypatch.setattr(eta, "JOB_DEADLINE_SECONDS", 600.0)
+    monkeypatch.setattr(eta, "JOB_DEADLINE_MIN_SECONDS", 90.0)
+    monkeypatch.setattr(eta, "JOB_DEADLINE_FACTOR", 3.0)
+    assert Deadline.for_job(10).budget == 90.0
+    assert Deadline.for_job(100).budget == 300.0
+    assert Deadline.for_job(1000).budget == 600.0
+    monkeypatch.setattr(eta, "JOB_DEADLINE_SECONDS", 0.0)
+    assert Deadline.for_job(100).remaining() is None
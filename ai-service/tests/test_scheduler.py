@@ -0,0 +1,42 @@
+import asyncio
+
+from app import scheduler as sched
+from app.scheduler import Lane, choose_lane
+
+
+def test_cheap_jobs_use_the_text_lane_whatever_their_type():
+    assert choose_lane(needs_ocr=True, pre_llm_seconds=3) == "text"
+    assert choose_lane(needs_ocr=False, pre_llm_seconds=3) == "text"
+
+
+def test_slow_jobs_split_by_ocr():
+    slow = sched.LANE_TEXT_MAX_SECONDS + 1
+    assert choose_lane(needs_ocr=True, pre_llm_seconds=slow) == "ocr"
+    assert choose_lane(needs_ocr=False, pre_llm_seconds=slow) == "large"
+
+
+def test_lane_runs_cheapest_waiting_job_first():
+    order = []
+
+    async def run():
+        lane = Lane("test", 1)
+        gate = asyncio.Event()
+
+        def job(name, wait=None):
+            async def body():
+                if wait:
+                    await wait.wait()
+                order.append(name)
+            return body
+
+        # The first job occupies the only slot while the others queue up
+        lane.submit(sched.QueuedJob("a", 1.0, job("a", gate), 0))
+        lane.submit(sched.QueuedJob("big", 500.0, job("big"), 1))
+        lane.submit(sched.QueuedJob("small", 5.0, job("small"), 2))
+        await asyncio.sleep(0)
+        gate.set()
+        while lane.running or lane.pending:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert order == ["a", "small", "big"]
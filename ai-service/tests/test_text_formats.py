@@ -0,0 +1,150 @@
+import codecs
+import io
+import zipfile
+
+import pytest
+
+from app.cancellation import CancelToken, JobCancelled
+from app.text_formats import detect_text_encoding, iter_docx_part_text, iter_docx_text, read_text_file
+
+W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+MC = "http://schemas.openxmlformats.org/markup-compatibility/2006"
+WPS = "http://schemas.microsoft.com/office/word/2010/wordprocessingShape"
+
+
+def _part(root: str, body: str) -> bytes:
+    return f'<?xml version="1.0" encoding="UTF-8"?><w:{root} xmlns:w="{W}" xmlns:mc="{MC}" xmlns:wps="{WPS}">{body}</w:{root}>'.encode("utf-8")
+
+
+def _p(text: str) -> str:
+    return f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>"
+
+
+def _tbl(*rows) -> str:
+    cells = lambda row: "".join(f"<w:tc>{c}</w:tc>" for c in row)
+    return "<w:tbl>" + "".join(f"<w:tr>{cells(r)}</w:tr>" for r in rows) + "</w:tbl>"
+
+
+def _docx(tmp_path, body: str, extra=None) -> str:
+    path = tmp_path / "doc.docx"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("word/document.xml", _part("document", f"<w:body>{body}</w:body>"))
+        for name, data in (extra or {}).items():
+            zf.writestr(name, data)
+    return str(path)
+
+
+def _lines(body: str):
+    return list(iter_docx_part_text(io.BytesIO(_part("document", f"<w:body>{body}</w:body>"))))
+
+
+# --- DOCX ---
+
+def test_docx_table_rows_are_joined_in_document_order():
+    body = _p("Intro") + _tbl([_p("Name"), _p("Value")], [_p("Mass"), _p("5 kg")]) + _p("Outro")
+    assert _lines(body) == ["Intro", "Name | Value", "Mass | 5 kg", "Outro"]
+
+
+def test_docx_nested_table_stays_inside_its_cell():
+    inner = _tbl([_p("a"), _p("b")])
+    body = _tbl([_p("outer") + inner, _p("right")])
+    assert _lines(body) == ["outer a | b | right"]
+
+
+def test_docx_text_box_is_read_once_skipping_the_fallback_copy():
+    box = "<w:txbxContent>" + _p("Boxed text") + "</w:txbxContent>"
+    body = (
+        "<w:p><w:r><mc:AlternateContent>"
+        f"<mc:Choice Requires=\"wps\"><wps:txbx>{box}</wps:txbx></mc:Choice>"
+        f"<mc:Fallback>{box}</mc:Fallback>"
+        "</mc:AlternateContent></w:r><w:r><w:t>Anchor</w:t></w:r></w:p>"
+    )
+    assert _lines(body) == ["Boxed text", "Anchor"]
+
+
+def test_docx_structured_document_tag_content_is_included():
+    body = "<w:sdt><w:sdtPr/><w:sdtContent>" + _p("Inside sdt") + "</w:sdtContent></w:sdt>" + _p("After")
+    assert _lines(body) == ["Inside sdt", "After"]
+
+
+def test_docx_reads_body_then_notes_then_headers_and_footers(tmp_path):
+    extra = {
+        "word/footnotes.xml": _part("footnotes", f"<w:footnote>{_p('A footnote')}</w:footnote>"),
+        "word/header1.xml": _part("hdr", _p("Running header")),
+        "word/footer1.xml": _part("ftr", _p("Running footer")),
+    }
+    path = _docx(tmp_path, _p("Body text"), extra)
+    assert list(iter_docx_text(path)) == ["Body text", "A footnote", "Running footer", "Running header"]
+
+
+def test_docx_parsing_stops_when_cancelled(tmp_path):
+    token = CancelToken("doc")
+    token.cancel()
+    with pytest.raises(JobCancelled):
+        list(iter_docx_text(_docx(tmp_path, _p("Body text")), token))
+
+
+# --- TXT ---
+
+def test_detects_boms_and_falls_back_to_latin1():
+    assert detect_text_encoding(codecs.BOM_UTF8 + b"abc") == ("utf-8", 3)
+    assert detect_text_encoding(codecs.BOM_UTF16_LE + "ab".encode("utf-16-le")) == ("utf-16-le", 2)
+    assert detect_text_encoding("café".encode("utf-8")[:-1]) == ("utf-8", 0)
+    assert detect_text_encoding("café".encode("latin-1"), complete=True) == ("latin-1", 0)
+    assert detect_text_encoding("café au lait".encode("latin-1")) == ("latin-1", 0)
+
+
+def test_reads_utf8_with_bom(tmp_path):
+    path = tmp_path / "bom.txt"
+    path.write_bytes(codecs.BOM_UTF8 + "Première ligne\n".encode("utf-8"))
+    assert read_text_file(str(path), 1000) == "Première ligne\n"
+
+
+def test_reads_utf16(tmp_path):
+    path = tmp_path / "utf16.txt"
+    path.write_bytes("Zweite Zeile: Größe".encode("utf-16"))
+    assert read_text_file(str(path), 1000) == "Zweite Zeile: Größe"
+
+
+def test_utf8_character_split_across_chunk_boundary(tmp_path, monkeypatch):
+    import app.text_formats as text_formats
+    monkeypatch.setattr(text_formats, "TXT_CHUNK_BYTES", 4)
+    text = "abc€def€"  # the first "€" starts at byte 3 and spans the 4-byte chunk boundary
+    path = tmp_path / "split.txt"
+    path.write_bytes(text.encode("utf-8"))
+    assert "".join(text_formats.iter_text_file(str(path), 4)) == text
+    assert read_text_file(str(path), 1000) == text
+
+
+def test_reads_short_latin1_file_ending_in_accent(tmp_path):
+    path = tmp_path / "latin1.txt"
+    path.write_bytes("Résumé: café".encode("latin-1"))
+    assert read_text_file(str(path), 1000) == "Résumé: café"
+
+
+def test_read_text_file_stops_at_max_chars(tmp_path):
+    path = tmp_path / "long.txt"
+    path.write_text("x" * 10000, encoding="utf-8")
+    assert read_text_file(str(path), 50) == "x" * 50
+
+
+def test_read_text_file_stops_when_cancelled(tmp_path):
+    path = tmp_path / "cancel.txt"
+    path.write_text("some text", encoding="utf-8")
+    token = CancelToken("doc")
+    token.cancel()
+    with pytest.raises(JobCancelled):
+        read_text_file(str(path), 1000, token)
+
+
+def test_whole_file_mode_keeps_later_content_within_the_cap(tmp_path, monkeypatch):
+    import app.text_formats as text_formats
+    monkeypatch.setattr(text_formats, "TXT_CHUNK_BYTES", 4096)
+    filler = "".join(f"Routine log entry {i} reports nothing unusual today.\n" for i in range(3000))
+    key = "Photosynthesis converts carbon dioxide and water into glucose using sunlight.\n"
+    path = tmp_path / "dump.txt"
+    path.write_text(filler + key, encoding="utf-8")
+    assert key.strip() not in read_text_file(str(path), 2000)
+    out = read_text_file(str(path), 2000, whole_file=True)
+    assert len(out) <= 2000
+    assert key.strip() in out